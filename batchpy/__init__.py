@@ -1,2 +1,48 @@
-from .run import *
-from .batch import *
+import sys
+
+
+# the public names are imported from their module when first accessed, which
+# keeps importing batchpy cheap for worker processes and the command line
+_exports = {
+    'Run': 'run',
+    'ResultRun': 'run',
+    'convert_run_to_newstyle': 'run',
+    'setup_worker': 'run',
+    'Batch': 'batch',
+    'run_async': 'batch',
+    'clear_res': 'batch',
+    'Progress': 'progress',
+    'ProgressState': 'progress',
+    'TerminalSink': 'progress',
+    'LogSink': 'progress',
+    'format_duration': 'progress',
+    'SharedArray': 'shared',
+}
+
+_submodules = ['batch', 'cli', 'derived', 'profiling', 'progress', 'run', 'shared', 'storage', 'summary']
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        import importlib
+
+        if name in _exports:
+            value = getattr(importlib.import_module('.' + _exports[name], __name__), name)
+            globals()[name] = value
+            return value
+        if name in _submodules:
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError('module \'{}\' has no attribute \'{}\''.format(__name__, name))
+
+    def __dir__():
+        return sorted(list(globals().keys()) + list(_exports.keys()) + _submodules)
+
+else:
+    # module __getattr__ is not supported
+    from .run import Run, ResultRun, convert_run_to_newstyle, setup_worker  # noqa: F401
+    from .batch import Batch, run_async, clear_res  # noqa: F401
+    from .progress import Progress, ProgressState, TerminalSink, LogSink, format_duration  # noqa: F401
+    from .shared import SharedArray  # noqa: F401
+
+
+__all__ = list(_exports.keys())
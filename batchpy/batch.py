@@ -19,13 +19,21 @@
 
 import os
 import sys
-import re
 import numpy as np
 import itertools
 import time
-from multiprocessing import Pool
+import queue
+import threading
+import hashlib
+import heapq
+import traceback
+import collections
 
-from .run import ResultRun
+from . import storage
+from . import profiling
+from . import shared
+from .progress import Progress, TerminalSink
+from .run import ResultRun, setup_worker
 
 
 class Batch(object):
@@ -41,9 +49,25 @@ class Batch(object):
     computations which would require more memory then available if all runs were
     to be executed at once.
 
+    Notes
+    -----
+    While a batch is called, runs are computed in worker processes but the
+    state of the runs is only modified by the thread which called the batch,
+    while holding the batch lock. Results are saved before a run is marked as
+    done.
+
+    Other threads, for instance a dashboard, can query the batch during the
+    computation with :py:meth:`~batchpy.batch.Batch.get_runs_with`,
+    :py:meth:`~batchpy.batch.Batch.snapshot`,
+    :py:meth:`~batchpy.batch.Batch.progress` and
+    :py:meth:`~batchpy.batch.Batch.telemetry` and load the results of done
+    runs. These methods work on a copy of the list of runs taken while holding
+    the lock. Calling a batch from several threads at the same time is not
+    supported.
+
     """
 
-    def __init__(self, name, path='', saveresult=True):
+    def __init__(self, name, path='', saveresult=True, telemetry=False, cache=None, summary=False):
         """
         Creates a batch.
 
@@ -59,6 +83,24 @@ class Batch(object):
         saveresult : boolean, optional
             Save the results to disk or not, this argument is passed to all runs.
 
+        telemetry : boolean, optional
+            Record timing, memory and I/O telemetry for each computed run. The
+            telemetry is stored with the run metadata and can be retrieved with
+            :py:meth:`~batchpy.batch.Batch.telemetry`.
+
+        cache : string, optional
+            A directory with results shared between batches. Results are stored
+            by the :py:meth:`~batchpy.run.Run.cache_key` of the run, computed
+            from the run class module and name, the run version, the code hash
+            and the run id. Runs found in the cache are linked into the batch
+            instead of computed.
+
+        summary : boolean or list of strings, optional
+            Keep a summary table with a row per run with the id, status,
+            runtime and parameters on disk, updated as runs finish. When a list
+            of keys is supplied, the scalar results with these keys are added
+            to the table. See :py:meth:`~batchpy.batch.Batch.summary`.
+
         Examples
         --------
         >>> batch = batchpy.Batch('mybatch')
@@ -68,7 +110,37 @@ class Batch(object):
         self.path = path
 
         self.run = []
+        self.shared = {}
+        self._ids = {}
         self._saveresult = saveresult
+        self._telemetry = telemetry
+        self._cache = cache
+        self._savepath_checked = None
+        self._listing = None
+        self._derived = collections.OrderedDict()
+
+        from .summary import Summary
+        record = summary is not False and summary is not None
+        self._summary = Summary(self, results=summary if record and summary is not True else [], record=record)
+
+        self._lock = threading.RLock()
+        self._tracker = None
+
+    def __getstate__(self):
+        # runs are pickled for computing them in other processes, the runs of
+        # the batch they belong to are not required there
+        state = self.__dict__.copy()
+        state['run'] = []
+        state['_ids'] = {}
+        state['_lock'] = None
+        state['_tracker'] = None
+        state['_listing'] = None
+        state['_derived'] = collections.OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
 
     def add_run(self, runclass, parameters):
         """
@@ -84,6 +156,11 @@ class Batch(object):
             A dictionary of parameters to be supplied to the
             :py:meth:`~batchpy.run.Run.run` method of the runclass.
 
+        Returns
+        -------
+        run : :py:meth:`~batchpy.run.Run` subclass instance
+            The added run.
+
         Examples
         --------
         >>> batch.add_run(Myrun,{'A':1,'B':[1,2,3],'C':'spam'})
@@ -92,9 +169,10 @@ class Batch(object):
         """
 
         run = runclass(self, saveresult=self._saveresult, **parameters)
-        self.run.append(run)
+        self._append(run)
+        return run
 
-    def add_factorial_runs(self, runclass, parameters):
+    def add_factorial_runs(self, runclass, parameters, shard=None):
         """
         Adds a full factorial design of runs based on parameter lists
 
@@ -108,6 +186,12 @@ class Batch(object):
             A dictionary of lists of parameters to be supplied to the
             :py:meth:`~batchpy.run.Run.run` method of the runclass.
 
+        shard : tuple, optional
+            A tuple ``(k, n)``, when supplied only the runs in shard k of n
+            shards are added, the same runs as selected by
+            :py:meth:`~batchpy.batch.Batch.shard` with the ``'hash'``
+            strategy. Runs outside the shard are not created.
+
         Examples
         --------
         >>> batch.add_factorial_runs(Myrun,{'par1':[0,1,2],'par2':[5.0,7.1]})
@@ -130,9 +214,136 @@ class Batch(object):
 
         valslist = list(itertools.product(*parameters.values()))
 
-        for vals in valslist:
-            par = {key: val for key, val in zip(parameters.keys(), vals)}
-            self.add_run(runclass, par)
+        # for large designs a single scan of the results folder is cheaper than
+        # checking the result file of each run
+        if len(valslist) > 100 and self._saveresult:
+            self._listing = storage.result_files(self.savepath, self.name)
+        try:
+            for vals in valslist:
+                par = {key: val for key, val in zip(parameters.keys(), vals)}
+                if shard is not None and _hash_shard(runclass.parameter_id(par), shard[1]) != shard[0]:
+                    continue
+                self.add_run(runclass, par)
+        finally:
+            self._listing = None
+
+    def shard(self, k, n, strategy='hash', cost=None):
+        """
+        Returns the indices of the runs in a shard of the batch
+
+        Parameters
+        ----------
+        k : int
+            The shard, :code:`0 <= k < n`.
+
+        n : int
+            The number of shards.
+
+        strategy : str, optional
+            ``'hash'`` assigns runs to shards by their id. The shard of a run
+            does not depend on the other runs, so adding runs does not move
+            existing runs to other shards. ``'round_robin'`` assigns the runs
+            sorted by id to the shards in turn, which gives shards which differ
+            at most one run in size. ``'cost_balanced'`` assigns the runs, from
+            the most to the least expensive, to the shard with the lowest total
+            cost, which evens out the wall time per shard.
+
+        cost : callable, optional
+            A function returning the expected cost of a run for the
+            ``'cost_balanced'`` strategy. By default the stored runtime is used
+            and runs without stored runtime are assumed to take the mean
+            runtime.
+
+        Notes
+        -----
+        All shards must be computed from the same costs, otherwise runs can be
+        assigned to several shards or to none. The stored runtimes change
+        while shards are computed, so by default the runtimes are frozen in
+        ``batchname_costs.npz`` in the results folder by the first call and
+        read from it by later calls, for instance by the other tasks of a job
+        array. Remove the file to use the current runtimes for a new set of
+        shards. A cost function must return the same costs in all tasks.
+
+        Returns
+        -------
+        runs : list of ints
+            The indices of the runs in the shard.
+
+        Examples
+        --------
+        >>> k = int(os.environ['SLURM_ARRAY_TASK_ID'])
+        >>> batch(runs=batch.shard(k, 100))
+
+        """
+
+        if n < 1 or not 0 <= k < n:
+            raise ValueError('Shard {} of {} not valid, should satisfy 0 <= k < n.'.format(k, n))
+
+        runs = self._runs()
+
+        if strategy == 'hash':
+            return [index for index, run in enumerate(runs) if _hash_shard(run.id, n) == k]
+
+        # sort by id so the result does not depend on the order of the runs
+        order = sorted(range(len(runs)), key=lambda index: runs[index].id)
+
+        if strategy == 'round_robin':
+            return sorted(order[k::n])
+
+        elif strategy == 'cost_balanced':
+            if cost is None:
+                runtimes = self._frozen_runtimes(runs)
+                default = np.mean(list(runtimes.values())) if len(runtimes) > 0 else 1.
+                costs = [runtimes.get(run.id, default) for run in runs]
+            else:
+                costs = [cost(run) for run in runs]
+
+            # the most expensive runs are assigned first, ties by id
+            order = sorted(order, key=lambda index: -costs[index])
+            loads = [(0., shard) for shard in range(n)]
+            inds = []
+            for index in order:
+                load, shard = heapq.heappop(loads)
+                if shard == k:
+                    inds.append(index)
+                heapq.heappush(loads, (load + costs[index], shard))
+            return sorted(inds)
+
+        else:
+            raise ValueError('Strategy \'{}\' not recognized, should be \'hash\', \'round_robin\' or '
+                             '\'cost_balanced\'.'.format(strategy))
+
+    def _frozen_runtimes(self, runs):
+        """
+        Returns the runtimes of runs by id from the costs file, which is
+        written from the stored runtimes when it does not exist.
+
+        """
+
+        filename = os.path.join(self.savepath, '{}_costs.npz'.format(self.name))
+        if not os.path.isfile(filename):
+            self._load_runtime(runs)
+            known = [run for run in runs if run._runtime is not None]
+            tempfilename = '{}.{}.tmp'.format(filename, os.getpid())
+            with open(tempfilename, 'wb') as f:
+                np.savez(f, id=np.array([run.id for run in known], dtype='U40'),
+                         runtime=np.array([run._runtime for run in known], dtype=float))
+            try:
+                # the file of the first process is kept when several processes
+                # write it at the same time
+                os.link(tempfilename, filename)
+            except FileExistsError:
+                pass
+            except OSError:
+                # file systems without hard links
+                if not os.path.isfile(filename):
+                    os.replace(tempfilename, filename)
+            finally:
+                if os.path.isfile(tempfilename):
+                    os.remove(tempfilename)
+
+        with np.load(filename) as data:
+            return dict(zip(data['id'].tolist(), data['runtime'].tolist()))
 
     def add_resultrun(self, id):
         """
@@ -140,8 +351,15 @@ class Batch(object):
 
         Parameters
         ----------
-        id : string or list of strings
-            The id of the run.
+        id : string, list of strings or numpy array
+            The id of the run, a list of ids or an array of raw 20 byte
+            digests with dtype ``S20`` as saved by
+            :py:meth:`~batchpy.batch.Batch.save_ids` in the 'bin' format.
+
+        Notes
+        -----
+        No files are read when adding result runs, the parameters and runtime
+        are loaded when they are first accessed.
 
         Examples
         --------
@@ -149,14 +367,16 @@ class Batch(object):
 
         """
 
-        if not hasattr(id, '__iter__'):
+        if isinstance(id, np.ndarray) and id.dtype.kind == 'S':
+            id = storage.hexdigests(id)
+        elif isinstance(id, str) or not hasattr(id, '__iter__'):
             id = [id]
 
         for idi in id:
             r = ResultRun(self, idi)
-            self.run.append(r)
+            self._append(r)
 
-    def add_resultrun_folder(self, folder=None):
+    def add_resultrun_folder(self, folder=None, metadata=True, threads=None):
         """
         Adds all runs saved in a directory
 
@@ -165,19 +385,45 @@ class Batch(object):
         folder : string, optional
             The directory where the results reside
 
+        metadata : bool, optional
+            Read the metadata (parameters and runtime) of all runs when adding
+            them. When :code:`False`, no files are read and the metadata is
+            loaded when it is first accessed.
+
+        threads : int, optional
+            The maximum number of threads used for reading the metadata.
+
         Examples
         --------
-        >>> batch.add_resultrun_dir()
+        >>> batch.add_resultrun_folder()
 
         """
         if folder is None:
             folder = self.savepath
-        files = [f for f in os.listdir(folder) if re.match(self.name + r'_.*\.npy', f)]
-        ids = []
-        for f in files:
-            id = os.path.splitext(os.path.basename(f))[0].split(self.name+'_')[1]
-            ids.append(id)
-        self.add_resultrun(ids)
+
+        files = storage.result_files(folder, self.name)
+        ids = list(files.keys())
+
+        if metadata:
+            for idi, data in zip(ids, storage.load_metadata_many([files[id] for id in ids], threads=threads)):
+                # skip files which do not contain run data
+                if data is not None:
+                    self._append(ResultRun(self, idi, metadata=data))
+        else:
+            for idi in ids:
+                self._append(ResultRun(self, idi))
+
+    def _append(self, run):
+        """
+        Appends a run to the batch and registers its index and id.
+
+        """
+
+        with self._lock:
+            run._index = len(self.run)
+            self.run.append(run)
+            if run.id not in self._ids:
+                self._ids[run.id] = run._index
 
     def get_runs_with(self, **kwargs):
         """
@@ -209,9 +455,24 @@ class Batch(object):
 
         """
 
+        allruns = self._runs()
+        summary = {}
+        if len(kwargs) > 0:
+            # the parameters of result runs are taken from the summary table
+            # when available, other metadata is loaded from the result files
+            unloaded = [run.id for run in allruns if isinstance(run, ResultRun) and not run._metadata_loaded]
+            if len(unloaded) > 0:
+                summary = self._summary.parameters(unloaded)
+            self._load_metadata(run for run in allruns if run.id not in summary)
+
         runs = []
-        for run in self.run:
+        for run in allruns:
             add = True
+            parameters = summary.get(run.id, run.parameters) if len(kwargs) > 0 else None
+            if len(kwargs) > 0 and parameters is None:
+                # result runs without a result file
+                continue
+
             for key, val in kwargs.items():
 
                 if key.endswith('__eq'):
@@ -248,8 +509,8 @@ class Batch(object):
                             return par == val
 
                 # check the condition
-                if key in run.parameters:
-                    con = condition(run.parameters[key], val)
+                if key in parameters:
+                    con = condition(parameters[key], val)
                     if hasattr(con, '__iter__'):
                         con = con.all()
 
@@ -262,7 +523,9 @@ class Batch(object):
 
         return runs
 
-    def __call__(self, runs=-1, verbose=1, processes=1):
+    def __call__(self, runs=-1, verbose=1, processes=1, progress=None, profile=None, profile_dir=None,
+                 sampler=None, prune=None, prune_running=False, warmup=False, max_inflight=None,
+                 memory=None, refresh=60.):
         """
         Runs the remainder of the batch or a specified run
 
@@ -277,51 +540,174 @@ class Batch(object):
         processes : int, optional
             Number of multiprocessing processes to run the batch.
 
+        progress : callable or list of callables, optional
+            Progress sinks, called with a
+            :py:class:`~batchpy.progress.ProgressState` at most once per
+            second. When not supplied, the progress is printed to the terminal
+            every 10 seconds if verbose is 1 and every second if verbose is 2.
+
+        profile : str, optional
+            Profile the computation of each run (``'runs'``), the dispatch loop
+            in the current process (``'dispatch'``) or both (``'both'``) using
+            cProfile. The profiles of the runs are merged in
+            ``batchname_runs.prof``, the dispatch profile is written to
+            ``batchname_dispatch.prof``. When both are profiled, runs computed
+            in the current process are not included in the dispatch profile.
+
+        profile_dir : str, optional
+            The directory to write profiles to, defaults to a ``_profile``
+            folder in the results folder.
+
+        sampler : callable, optional
+            A function called as ``sampler(run, result)`` for each finished
+            run, which returns new runs to compute as an iterable of parameter
+            dictionaries, using the class of the finished run, or of
+            ``(runclass, parameters)`` tuples. New runs are added to the batch
+            and dispatched right away, proposed runs which are already in the
+            batch are ignored. The sampler is also called for the selected runs
+            which are done at the start.
+
+        prune : callable, optional
+            A predicate called as ``prune(run, finished, result)`` for a
+            queued run and each run finished since the queued run was last
+            checked, when the queued run is about to be computed. Runs for
+            which it returns :code:`True` are not computed but marked as
+            skipped. Skipped runs are not done and are considered again when
+            the batch is called again. The results of finished runs are kept
+            in memory while runs are queued. When supplied, runs are only
+            submitted to the pool when a process is available, unless
+            max_inflight is supplied.
+
+        prune_running : bool, optional
+            Also evaluate the prune predicate for runs which are being computed.
+            A running computation can not be interrupted, but its result is
+            discarded and the run is marked as skipped.
+
+        warmup : bool, optional
+            Call the :py:meth:`~batchpy.run.Run.setup_worker` hook of the
+            classes of the selected runs when the worker processes are started,
+            before any run is dispatched. Otherwise the hook is called before
+            the first run of a class is computed in a process.
+
+        max_inflight : int, optional
+            The maximum number of runs submitted to the pool of processes and
+            not yet finished. New runs are submitted as runs finish, which
+            bounds the memory used by queued tasks and unsaved results
+            regardless of the size of the batch. Defaults to twice the number
+            of processes, or the number of processes when pruning or when a
+            memory budget is supplied.
+
+        memory : number, optional
+            A memory budget in bytes for the runs computed at the same time in
+            the pool of processes. Runs are only submitted while the sum of the
+            estimated memory of the runs being computed fits in the budget,
+            smaller runs further in the queue are submitted when the next run
+            does not fit. The estimate of a run is taken from
+            :py:meth:`~batchpy.run.Run.memory_estimate`, or otherwise from the
+            peak memory in the telemetry of the finished run of the same class
+            with the most similar parameters, which requires a batch with
+            telemetry. Runs without estimate are assumed to use the budget
+            divided by the number of processes. A run is always submitted when
+            no other runs are being computed.
+
+        refresh : number, optional
+            The minimum time in seconds between two refreshes of the done state
+            of the queued runs with :py:meth:`~batchpy.batch.Batch.refresh`.
+            Before submitting runs, queued runs which were finished by other
+            processes are removed from the queue. :code:`None` only refreshes
+            the done state when the batch is called.
+
+        Examples
+        --------
+        >>> batch(processes=4, progress=batchpy.LogSink())
+        >>> batch(processes=8, memory=64e9)
+
+        >>> thread = threading.Thread(target=batch, kwargs={'processes': 4})
+        >>> thread.start()
+        >>> batch.progress()
+        ProgressState(done=12, failed=0, skipped=0, total=100, ...)
+        >>> batch(profile='both')
+
+        >>> def sampler(run, result):
+        ...     if result['val'] > 5:
+        ...         return [{'mypar': run.parameters['mypar'] / 2}]
+        ...
+        >>> batch(sampler=sampler)
+
+        >>> def prune(run, finished, result):
+        ...     return run.parameters['mypar'] > finished.parameters['mypar'] and result['val'] > 100
+        ...
+        >>> batch(prune=prune)
+
         """
 
         # check which runs are to be done
         expandedruns = []
+        finishedruns = []
 
         if isinstance(runs, list) or isinstance(runs, np.ndarray):
-            for ind in runs:
-                if not self.run[ind].done:
-                    expandedruns.append(ind)
+            inds = runs
+        elif runs < 0:
+            inds = range(len(self.run))
         else:
-            if runs < 0:
-                for ind in range(len(self.run)):
-                    if not self.run[ind].done:
-                        expandedruns.append(ind)
-
-            elif not self.run[runs].done:
-                expandedruns.append(runs)
-
-        def success_callback(result):
-            i = result['i']
-            run_inds = result['run_inds']
-            self.run[run_inds[i]]._done = True
-            self.run[run_inds[i]]._runtime = result['runtime']
-            if self.run[run_inds[i]]._saveresult:
-                self.run[run_inds[i]]._save(result['res'])
+            inds = [runs]
+
+        # runs finished by other processes are marked as done
+        self.refresh(inds)
+
+        for ind in inds:
+            if not self.run[ind].done and not self.run[ind]._fetch_cache():
+                expandedruns.append(ind)
             else:
-                self.run[run_inds[i]]._result = result['res']
-            if verbose > 0:
-                print_progress(i, run_inds, starttime, self.run, async=True, verbose=verbose)
-
-        if processes > 1:
-            starttime = time.time()
-            with Pool(processes=processes) as pool:
-                for i in range(len(expandedruns)):
-                    pool.apply_async(run_async, args=(i, expandedruns, starttime, self.run,), callback=success_callback)
-
-                pool.close()
-                pool.join()
+                finishedruns.append(ind)
+
+        if profile not in profiling.PROFILE_MODES:
+            raise ValueError('Profile \'{}\' not recognized, should be \'runs\', \'dispatch\' or \'both\'.'
+                             .format(profile))
+
+        if profile is not None:
+            if profile_dir is None:
+                profile_dir = os.path.join(self.savepath, '_profile')
+            if not os.path.isdir(profile_dir):
+                os.makedirs(profile_dir)
+
+        if progress is not None:
+            tracker = Progress(len(expandedruns), sinks=progress, interval=1.)
+        elif verbose > 1:
+            tracker = Progress(len(expandedruns), sinks=TerminalSink(), interval=1.)
+        elif verbose > 0:
+            tracker = Progress(len(expandedruns), sinks=TerminalSink(), interval=10.)
         else:
-            starttime = time.time()
-            for i in range(len(expandedruns)):
-                if verbose > 0:
-                    print_progress(i, expandedruns, starttime, self.run, async=False, verbose=verbose)
-                self.run[expandedruns[i]]()
+            tracker = Progress(len(expandedruns))
+
+        self._tracker = tracker
+        dispatcher = _Dispatcher(self, expandedruns, tracker, processes=processes, verbose=verbose,
+                                 sampler=sampler, prune=prune, prune_running=prune_running,
+                                 profile_dir=profile_dir if profile in ['runs', 'both'] else None,
+                                 warmup=warmup, max_inflight=max_inflight, memory=memory, refresh=refresh)
+
+        if memory is not None:
+            self._load_telemetry(self.run[ind] for ind in finishedruns)
+            for ind in finishedruns:
+                dispatcher.estimator.add(self.run[ind])
+
+        if sampler is not None:
+            for ind in finishedruns:
+                dispatcher.sample(self.run[ind], self.run[ind].load())
+
+        starttime = time.time()
+        try:
+            if profile in ['dispatch', 'both']:
+                filename = os.path.join(profile_dir, '{}_dispatch.prof'.format(self.name))
+                profiling.profile(dispatcher, filename)
+            else:
+                dispatcher()
+        finally:
+            dispatcher.close()
+            if self._summary.record:
+                self._summary.write()
 
+        tracker.poll(force=True)
         runtime = time.time() - starttime
 
         if verbose > 0:
@@ -329,23 +715,283 @@ class Batch(object):
             print('done')
             sys.stdout.flush()
 
+    def clear(self, runs=None, where=None, threads=None):
+        """
+        Removes the saved results of runs from the disk
+
+        The files are removed in parallel using a thread pool and the cleared
+        runs are marked as not done. Results in a shared cache are not removed.
+
+        Parameters
+        ----------
+        runs : list of ints, optional
+            Indices of the runs to clear, defaults to all runs.
+
+        where : dict or callable, optional
+            Only clear runs with the parameter values in the dictionary, using
+            the conditions of :py:meth:`~batchpy.batch.Batch.get_runs_with`, or
+            for which the callable returns :code:`True`.
+
+        threads : int, optional
+            The maximum number of threads used for removing files.
+
+        Returns
+        -------
+        report : dict
+            A dictionary with the number of cleared runs (``runs``), the
+            number of removed files (``files``), their total size in bytes
+            (``size``) and a list of files which could not be removed
+            (``failed``).
+
+        Examples
+        --------
+        >>> report = batch.clear(where={'par1__ge': 1})
+        >>> print('freed {} bytes'.format(report['size']))
+
+        """
+
+        allruns = self._runs()
+        if runs is None:
+            selected = allruns
+        else:
+            selected = [allruns[ind] for ind in runs]
+
+        if isinstance(where, dict):
+            ids = set(run.id for run in self.get_runs_with(**where))
+            selected = [run for run in selected if run.id in ids]
+        elif where is not None:
+            selected = [run for run in selected if where(run)]
+
+        # result runs refer to results of other batches, they are not removed
+        selected = [run for run in selected if run._saveresult and not isinstance(run, ResultRun)]
+
+        filenames = []
+        for run in selected:
+            filenames.append(run.filename)
+            filenames.append(run.checkpointfilename)
+        report = storage.remove_many(filenames, threads=threads)
+
+        failed = set(report['failed'])
+        removed = [run.id for run in selected if run.filename not in failed]
+        with self._lock:
+            for run in selected:
+                if run.filename not in failed:
+                    run._done = False
+            if self._summary.record:
+                self._summary.remove(removed)
+        # memoized derived quantities of removed results are computed again
+        from .derived import invalidate
+        invalidate(self.savepath, self.name, removed)
+
+        report['runs'] = len(selected)
+        return report
+
+    def retain(self, keep=None, max_age=None, max_size=None, threads=None):
+        """
+        Removes saved results according to a retention policy
+
+        All results of the batch in the results folder are considered, also
+        those of runs which are not part of the batch.
+
+        Parameters
+        ----------
+        keep : int, optional
+            Keep only the most recently saved results.
+
+        max_age : number, optional
+            Remove results saved more than max_age seconds ago.
+
+        max_size : number, optional
+            Remove the oldest results until the total size of the results is
+            at most max_size bytes.
+
+        threads : int, optional
+            The maximum number of threads used for removing files.
+
+        Returns
+        -------
+        report : dict
+            See :py:meth:`~batchpy.batch.Batch.clear`.
+
+        Examples
+        --------
+        >>> batch.retain(max_age=30*24*3600, max_size=100e9)
+
+        """
+
+        files = storage.result_files(self.savepath, self.name)
+        stats = {}
+        for id, filename in files.items():
+            try:
+                stats[id] = os.stat(filename)
+            except OSError:
+                pass
+
+        # newest first
+        ids = sorted(stats.keys(), key=lambda id: -stats[id].st_mtime)
+        remove = set()
+        if keep is not None:
+            remove.update(ids[keep:])
+        if max_age is not None:
+            now = time.time()
+            remove.update(id for id in ids if now - stats[id].st_mtime > max_age)
+        if max_size is not None:
+            size = 0
+            for id in ids:
+                size += stats[id].st_size
+                if size > max_size:
+                    remove.add(id)
+
+        report = storage.remove_many([files[id] for id in sorted(remove)], threads=threads)
+
+        failed = set(report['failed'])
+        removed = set(id for id in remove if files[id] not in failed)
+        with self._lock:
+            for run in self.run:
+                if run.id in removed and not isinstance(run, ResultRun):
+                    run._done = False
+            if self._summary.record:
+                self._summary.remove(removed)
+        # memoized derived quantities of removed results are computed again
+        from .derived import invalidate
+        invalidate(self.savepath, self.name, removed)
+
+        report['runs'] = len(remove)
+        return report
+
+    def refresh(self, runs=None):
+        """
+        Updates the done state of runs with saved results from a single scan
+        of the results folder
+
+        Runs which were computed by other processes, for instance other jobs
+        of a job array, are marked as done, runs of which the result file was
+        removed are marked as not done. Runs which do not save their result
+        are not changed.
+
+        Parameters
+        ----------
+        runs : list of ints, optional
+            Indices of the runs to refresh, defaults to all runs.
+
+        Returns
+        -------
+        done : numpy array
+            A boolean array with the done state of the runs.
+
+        Examples
+        --------
+        >>> done = batch.refresh()
+        >>> print('{} of {} runs done'.format(done.sum(), len(done)))
+
+        """
+
+        files = storage.result_files(self.savepath, self.name)
+        with self._lock:
+            if runs is None:
+                runs = range(len(self.run))
+            done = np.zeros(len(runs), dtype=bool)
+            for i, ind in enumerate(runs):
+                run = self.run[ind]
+                if run._saveresult and not isinstance(run, ResultRun):
+                    run._done = run._id in files
+                done[i] = run._done
+        return done
+
+    def _finish_run(self, result):
+        """
+        Stores the result of a run computed in another process.
+
+        The result is written outside of the lock, so the state of the batch
+        can be queried while it is saved. The run is marked as done after its
+        result is saved.
+
+        """
+
+        with self._lock:
+            run = self.run[result['index']]
+
+        if run._saveresult:
+            run._save(result['res'], runtime=result['runtime'], telemetry=result['telemetry'])
+            run._store_cache()
+        run._remove_checkpoint()
+
+        with self._lock:
+            run._runtime = result['runtime']
+            run._telemetry = result['telemetry']
+            if not run._saveresult:
+                run._result = result['res']
+            run._done = True
+
+    def snapshot(self):
+        """
+        Returns a consistent copy of the state of all runs
+
+        The snapshot can be taken from another thread while the batch is
+        computed.
+
+        Returns
+        -------
+        table : numpy structured array
+            An array with a row per run and fields ``index``, ``id``,
+            ``done``, ``skipped`` and ``runtime``. The runtime is ``nan`` when
+            it is not known.
+
+        Examples
+        --------
+        >>> table = batch.snapshot()
+        >>> table['done'].sum()
+
+        """
+
+        with self._lock:
+            rows = [(index, run.id, run._done, run._skipped, np.nan if run._runtime is None else run._runtime)
+                    for index, run in enumerate(self.run)]
+
+        idlength = max([len(row[1]) for row in rows] + [1])
+        dtype = [('index', 'i8'), ('id', 'U{}'.format(idlength)), ('done', '?'), ('skipped', '?'),
+                 ('runtime', 'f8')]
+        return np.array(rows, dtype=dtype)
+
+    def progress(self):
+        """
+        Returns the progress of the current or last call of the batch
+
+        Returns
+        -------
+        state : :py:class:`~batchpy.progress.ProgressState`, :code:`None`
+            The progress state or :code:`None` when the batch was not called
+            yet.
+
+        """
+
+        tracker = self._tracker
+        if tracker is None:
+            return None
+        return tracker.state()
+
     def save_ids(self, filename=None, format='npy'):
         """
-        Saves all ids in the batch to a python file with an ``ids`` list
+        Saves all ids in the batch to a file
 
         Parameters
         ----------
         filename : str, optional
             The filename of the output file. If no filename is supplied a
-            file is created in the ``_res`` folder, named ``batchname_ids.npy``
-            or ``batchname_ids.py`` depending on the format argument.
+            file is created in the ``_res`` folder, named
+            ``batchname_ids.format``.
             If a filename is supplied, the format argument is ignored and the
             filename extension is used to determine the format.
 
         format : str, optional
-            The format to save the ids to, 'npy'/'py'. By default, a .npy file
-            is created, the ids can be retrieved with
-            ``ids = np.load('batchname_ids.npy')``. If the 'py' format is
+            The format to save the ids to, 'npy'/'bin'/'txt'/'py'. By default,
+            a .npy file is created, the ids can be retrieved with
+            ``ids = np.load('batchname_ids.npy')``. The 'bin' format stores
+            the ids as raw 20 byte digests, an eighth of the size of the 'npy'
+            format, which can be loaded with
+            ``ids = np.fromfile('batchname_ids.bin', dtype='S20')`` and added to
+            a batch directly with :py:meth:`~batchpy.batch.Batch.add_resultrun`.
+            The 'txt' format writes an id per line. If the 'py' format is
             supplied the ids are written to a python file in a list.
 
         Examples
@@ -358,6 +1004,9 @@ class Batch(object):
         >>> ids = np.load('_res/mybatch_ids.npy')
         >>> print(ids)
 
+        >>> batch.save_ids(format='bin')
+        >>> batch.add_resultrun(np.fromfile('_res/mybatch_ids.bin', dtype='S20'))
+
         """
 
         if filename is None:
@@ -365,19 +1014,295 @@ class Batch(object):
         else:
             format = os.path.splitext(filename)[1][1:]
 
-        if format == 'npy':
-            np.save(filename, [run.id for run in self.run])
+        storage.save_ids(filename, [run.id for run in self._runs()], format=format)
 
-        elif format == 'py':
-            with open(filename, 'w') as f:
+    def share(self, key, array, backend='auto'):
+        """
+        Registers a large read-only input which is shared between processes
 
-                f.write('ids = [\n')
-                for run in self.run:
-                    f.write('    \'{}\',\n'.format(run.id))
+        The data is copied once to shared memory or a memory mapped file. The
+        returned array can be used as a run parameter, usually a private one,
+        or accessed through the :code:`shared` attribute of the batch inside
+        the run method. When runs are computed in a pool of processes only a
+        reference is sent to the workers, which attach to the shared data
+        without copying it.
 
-                f.write(']')
-        else:
-            raise Exception('Format \'{}\' not recognized, should be \'npy\' or \'py\'.'.format(format))
+        Parameters
+        ----------
+        key : string
+            A key for the shared data.
+
+        array : array_like
+            The data to share.
+
+        backend : string, optional
+            ``'shm'`` for :code:`multiprocessing.shared_memory`, ``'mmap'``
+            for a memory mapped file in the ``_shared`` folder in the results
+            folder or ``'auto'`` to use shared memory when available.
+
+        Returns
+        -------
+        array : :py:class:`~batchpy.shared.SharedArray`
+            A read-only view of the shared data.
+
+        Examples
+        --------
+        >>> weather = batch.share('weather', np.load('weather.npy'))
+        >>> batch.add_factorial_runs(Myrun, {'par1': [0, 1, 2], '_weather': weather})
+        >>> batch(processes=4)
+        >>> batch.unshare()
+
+        """
+
+        if key in self.shared:
+            self.unshare(key)
+
+        name = 'batchpy_{}_{}'.format(os.getpid(), hashlib.sha1('{}_{}'.format(self.name, key).encode('utf-8'))
+                                      .hexdigest()[:10])
+        self.shared[key] = shared.create(array, name, directory=os.path.join(self.savepath, '_shared'),
+                                         backend=backend)
+        return self.shared[key]
+
+    def unshare(self, key=None):
+        """
+        Releases shared data
+
+        Parameters
+        ----------
+        key : string, optional
+            The key of the shared data, when not supplied all shared data of the
+            batch is released.
+
+        """
+
+        keys = list(self.shared.keys()) if key is None else [key]
+        for key in keys:
+            shared.release(self.shared.pop(key))
+
+    def derived(self, func=None, name=None):
+        """
+        Registers a quantity derived from the result of a run
+
+        Can be used as a decorator. The values of the derived quantity are
+        computed from the results of done runs when requested and memoized on
+        disk by run id and a hash of the code of the function, so results are
+        only loaded for runs of which the value was not computed before.
+
+        Parameters
+        ----------
+        func : callable
+            A function computing the quantity from the result of a run.
+
+        name : string, optional
+            The name of the quantity, defaults to the function name.
+
+        Returns
+        -------
+        derived : :py:class:`~batchpy.derived.Derived`
+            A callable returning the values of the quantity for the runs of the
+            batch.
+
+        Examples
+        --------
+        >>> @batch.derived
+        ... def energy(result):
+        ...     return np.trapz(result['power'], result['time'])
+        ...
+        >>> energy()
+        array([ 12.1,  13.4,  nan])
+        >>> table = batch.derived_table()
+        >>> table['energy']
+
+        """
+
+        if func is None:
+            return lambda func: self.derived(func, name=name)
+
+        from .derived import Derived
+
+        derived = Derived(self, func, name=name)
+        self._derived[derived.name] = derived
+        return derived
+
+    def derived_table(self, names=None, runs=None, processes=1):
+        """
+        Returns a table with derived quantities of runs
+
+        Parameters
+        ----------
+        names : list of strings, optional
+            The names of the derived quantities, defaults to all registered
+            quantities.
+
+        runs : list of ints, optional
+            Indices of the runs, defaults to all runs.
+
+        processes : int, optional
+            Number of processes used to compute missing values.
+
+        Returns
+        -------
+        table : numpy structured array
+            An array with a row per run and fields ``index``, ``id`` and a
+            field per derived quantity.
+
+        """
+
+        if names is None:
+            names = list(self._derived.keys())
+        if runs is None:
+            runs = list(range(len(self.run)))
+
+        columns = [self._derived[name](runs=runs, processes=processes) for name in names]
+        allruns = self._runs()
+        ids = [allruns[ind].id for ind in runs]
+
+        idlength = max([len(id) for id in ids] + [1])
+        dtype = [('index', 'i8'), ('id', 'U{}'.format(idlength))] + \
+                [(name, column.dtype) for name, column in zip(names, columns)]
+        table = np.empty(len(runs), dtype=dtype)
+        table['index'] = runs
+        table['id'] = ids
+        for name, column in zip(names, columns):
+            table[name] = column
+        return table
+
+    def summary(self):
+        """
+        Returns the summary table of the batch
+
+        The table is kept on disk when the batch is created with the
+        ``summary`` argument and holds a row per run computed with the
+        summary enabled, also by other processes or in earlier sessions.
+        The table is stored in ``{name}_summary.npz`` in the results folder
+        and chunks with recent rows, it can also be read without creating the
+        batch with :py:func:`batchpy.summary.load`.
+
+        Returns
+        -------
+        columns : dict
+            A dictionary of numpy arrays with the columns ``id``, ``status``,
+            ``runtime``, ``parameters.{key}`` for each parameter and
+            ``results.{key}`` for each selected result. Missing values are
+            ``None`` or ``nan``.
+
+        Examples
+        --------
+        >>> batch = batchpy.Batch('mybatch', summary=['cost'])
+        >>> batch.add_factorial_runs(Myrun, {'par1': [0, 1, 2], 'par2': [5.0, 7.1]})
+        >>> batch()
+        >>> table = pandas.DataFrame(batch.summary())
+
+        """
+
+        if self._summary.record:
+            self._summary.write()
+        return dict(self._summary.table())
+
+    def telemetry(self):
+        """
+        Returns a table with the telemetry of all runs for which it was
+        recorded
+
+        Returns
+        -------
+        table : numpy structured array
+            An array with a row per run and fields ``index``, ``id``, ``wall``,
+            ``cpu``, ``maxrss``, ``maxrss_reset``, ``task``, ``serialize``,
+            ``save``, ``size``, ``worker`` and ``pid``, see
+            :py:attr:`~batchpy.run.Run.telemetry`. Missing values are ``nan``
+            or ``-1``.
+
+        Examples
+        --------
+        >>> batch = batchpy.Batch('mybatch', telemetry=True)
+        >>> batch.add_factorial_runs(Myrun, {'par1': [0, 1, 2]})
+        >>> batch(processes=2)
+        >>> table = batch.telemetry()
+        >>> table['maxrss'].max()
+
+        """
+
+        allruns = self._runs()
+        self._load_telemetry(allruns)
+
+        rows = []
+        for index, run in enumerate(allruns):
+            telemetry = run._telemetry
+            if telemetry is None:
+                continue
+
+            def value(key, default):
+                val = telemetry.get(key)
+                return default if val is None else val
+
+            rows.append((index, run.id,
+                         value('wall', np.nan), value('cpu', np.nan), value('maxrss', -1), value('maxrss_reset', False),
+                         value('task', -1), value('serialize', np.nan), value('save', np.nan), value('size', -1),
+                         value('worker', ''), value('pid', -1)))
+
+        idlength = max([len(row[1]) for row in rows] + [1])
+        workerlength = max([len(row[10]) for row in rows] + [1])
+        dtype = [('index', 'i8'), ('id', 'U{}'.format(idlength)),
+                 ('wall', 'f8'), ('cpu', 'f8'), ('maxrss', 'i8'), ('maxrss_reset', '?'), ('task', 'i8'),
+                 ('serialize', 'f8'), ('save', 'f8'), ('size', 'i8'),
+                 ('worker', 'U{}'.format(workerlength)), ('pid', 'i8')]
+        return np.array(rows, dtype=dtype)
+
+    def _runs(self):
+        """
+        Returns a copy of the list of runs.
+
+        """
+
+        with self._lock:
+            return list(self.run)
+
+    def _load_runtime(self, runs):
+        """
+        Loads the runtime of done runs computed earlier from their metadata.
+
+        """
+
+        self._load_metadata(runs)
+
+        runs = [run for run in runs
+                if not isinstance(run, ResultRun) and run._runtime is None and run.done and run._saveresult]
+        if len(runs) > 0:
+            filenames = [run.filename for run in runs]
+            for run, data in zip(runs, storage.load_metadata_many(filenames)):
+                if data is not None:
+                    run._runtime = data.get('runtime')
+
+    def _load_telemetry(self, runs):
+        """
+        Loads the telemetry of runs computed earlier from their metadata.
+
+        """
+
+        runs = list(runs)
+        self._load_metadata(runs)
+
+        runs = [run for run in runs
+                if not isinstance(run, ResultRun) and run._telemetry is None and run.done and run._saveresult]
+        if len(runs) > 0:
+            filenames = [run.filename for run in runs]
+            for run, data in zip(runs, storage.load_metadata_many(filenames)):
+                if data is not None:
+                    run._telemetry = data.get('telemetry')
+
+    def _load_metadata(self, runs, threads=None):
+        """
+        Loads the metadata of all result runs in runs which was not loaded yet
+        in bulk using a thread pool.
+
+        """
+
+        runs = [run for run in runs if isinstance(run, ResultRun) and not run._metadata_loaded]
+        if len(runs) > 0:
+            filenames = [run.filename for run in runs]
+            for run, data in zip(runs, storage.load_metadata_many(filenames, threads=threads)):
+                run._set_metadata(data)
 
     @property
     def savepath(self):
@@ -387,6 +1312,10 @@ class Batch(object):
         """
         dirname = os.path.join(self.path, '_res')
 
+        # the directory is only checked once per path
+        if self._savepath_checked == dirname:
+            return dirname
+
         if not os.path.isdir(dirname):
             os.makedirs(dirname)
 
@@ -394,86 +1323,414 @@ class Batch(object):
             with open(os.path.join(dirname, '__init__.py'), 'w'):
                 pass
 
+        self._savepath_checked = dirname
         return dirname
 
 
+class _Dispatcher(object):
+    """
+    Computes runs of a batch serially or in a pool of processes
+
+    The dispatcher keeps a queue of pending run indices, to which runs proposed
+    by a sampler are added and from which pruned runs are removed while
+    computing.
+
+    """
+
+    def __init__(self, batch, inds, tracker, processes=1, verbose=1, sampler=None, prune=None, prune_running=False,
+                 profile_dir=None, warmup=False, max_inflight=None, memory=None, refresh=None):
+        self.batch = batch
+        self.pending = collections.deque(inds)
+        self.tracker = tracker
+        self.processes = processes
+        self.verbose = verbose
+        self.sampler = sampler
+        self.prune = prune
+        self.prune_running = prune_running
+        # queued runs are checked against the runs finished since they were
+        # last checked when they are about to be submitted
+        self.finished = []
+        self.checked = {}
+        self.profile_dir = profile_dir
+        self.profiled = []
+        self.warmup = warmup
+
+        # runs are submitted in a bounded window, refilled as runs finish
+        # queued runs can only be pruned when they are not submitted yet
+        if max_inflight is None:
+            max_inflight = processes if prune is not None or memory is not None else 2 * processes
+        if max_inflight < 1:
+            raise ValueError('max_inflight should be at least 1.')
+        self.max_inflight = max_inflight
+
+        # runs are only submitted while their estimated memory fits the budget
+        self.memory = memory
+        self.estimator = _MemoryEstimator(None if memory is None else memory / processes)
+        self.reserved = {}
+
+        # the done state of queued runs is refreshed before submitting runs
+        self.refresh = refresh
+        self.refreshed = time.monotonic()
+        self.inflight = set()
+        self.cancelled = set()
+
+    def __call__(self):
+        if self.processes > 1:
+            self._run_pool()
+        else:
+            self._run_serial()
+
+    def _runclasses(self):
+        return list(collections.OrderedDict((type(self.batch.run[ind]), None) for ind in self.pending))
+
+    def _run_serial(self):
+        if self.warmup:
+            setup_worker(self._runclasses())
+        while len(self.pending) > 0:
+            self._refresh()
+            ind = self._next()
+            if ind is None:
+                break
+            run = self._prepare(ind)
+            self.tracker.poll()
+            res, runtime = run._run()
+            self.reserved.pop(ind, None)
+            self.batch._finish_run({'index': ind, 'res': res, 'runtime': runtime, 'telemetry': run._telemetry})
+            self._finished(run, res)
+
+    def _run_pool(self):
+        # results are passed from the pool result handler thread to the main
+        # thread through a queue, saving them is done here
+        from multiprocessing import Pool
+
+        results = queue.Queue()
+        if self.warmup:
+            pool = Pool(processes=self.processes, initializer=setup_worker, initargs=(self._runclasses(),))
+        else:
+            pool = Pool(processes=self.processes)
+        with pool:
+            while len(self.pending) > 0 or len(self.inflight) > 0:
+                if len(self.inflight) < self.max_inflight:
+                    self._refresh()
+                while len(self.inflight) < self.max_inflight:
+                    ind = self._next()
+                    if ind is None:
+                        break
+                    # errors outside the run, for instance pickling the result,
+                    # are passed to the error callback
+                    pool.apply_async(run_async, args=(ind, self._prepare(ind)), callback=results.put,
+                                     error_callback=_error_callback(results, ind))
+                    self.inflight.add(ind)
+
+                try:
+                    result = results.get(timeout=self.tracker.interval)
+                except queue.Empty:
+                    self.tracker.poll()
+                    continue
+
+                ind = result['index']
+                self.inflight.discard(ind)
+                self.reserved.pop(ind, None)
+                if ind in self.cancelled:
+                    self.cancelled.discard(ind)
+                    self._skip(self.batch.run[ind])
+                elif 'error' in result:
+                    if self.verbose > 0:
+                        print('run {} failed:\n{}'.format(ind, result['error']))
+                    self.tracker.update(ind, failed=True)
+                    self._summarize(self.batch.run[ind], 'failed')
+                else:
+                    self.batch._finish_run(result)
+                    self.estimator.add(self.batch.run[ind])
+                    self._finished(self.batch.run[ind], result['res'])
+                self.tracker.poll()
+
+            pool.close()
+            pool.join()
+
+    def _refresh(self):
+        """
+        Removes queued runs which were finished by other processes, at most
+        once per refresh interval.
+
+        """
+
+        now = time.monotonic()
+        if self.refresh is None or now - self.refreshed < self.refresh or len(self.pending) == 0:
+            return
+        self.refreshed = now
+
+        inds = list(self.pending)
+        done = self.batch.refresh(inds)
+        if done.any():
+            self.pending = collections.deque(ind for ind, d in zip(inds, done) if not d)
+            for ind, d in zip(inds, done):
+                if d:
+                    self.tracker.update(ind)
+
+    def _next(self):
+        """
+        Removes and returns the index of the next run to submit or
+        :code:`None` when no run fits in the memory budget.
+
+        """
+
+        if self.memory is None:
+            while len(self.pending) > 0:
+                ind = self.pending.popleft()
+                if not self._pruned(ind):
+                    self.checked.pop(ind, None)
+                    return ind
+            return None
+
+        available = self.memory - sum(self.reserved.values())
+        i = 0
+        while i < min(len(self.pending), self.lookahead):
+            ind = self.pending[i]
+            if self._pruned(ind):
+                del self.pending[i]
+                continue
+            estimate = self.estimator(self.batch.run[ind])
+            if estimate <= available or len(self.inflight) == 0:
+                del self.pending[i]
+                self.reserved[ind] = estimate
+                self.checked.pop(ind, None)
+                return ind
+            i += 1
+        return None
+
+    def _pruned(self, ind):
+        """
+        Returns :code:`True` and marks a queued run as skipped when it is
+        ruled out by the prune predicate for a run finished since it was last
+        checked.
+
+        """
+
+        if self.prune is None:
+            return False
+
+        run = self.batch.run[ind]
+        for finished, res in itertools.islice(self.finished, self.checked.get(ind, 0), None):
+            if self.prune(run, finished, res):
+                self.checked.pop(ind, None)
+                self._skip(run)
+                return True
+        self.checked[ind] = len(self.finished)
+        return False
+
+    # the number of queued runs considered for filling the memory budget
+    lookahead = 100
+
+    def _prepare(self, ind):
+        run = self.batch.run[ind]
+        with self.batch._lock:
+            run._skipped = False
+        if self.profile_dir is not None:
+            run._profile = os.path.join(self.profile_dir, '{}_{}.prof'.format(self.batch.name, run.id))
+            self.profiled.append((run, run._profile))
+        return run
+
+    def _finished(self, run, res):
+        self.tracker.update(run.index)
+        self._summarize(run, 'done', res)
+        if self.sampler is not None:
+            self.sample(run, res)
+        if self.prune is not None:
+            if len(self.pending) > 0:
+                self.finished.append((run, res))
+            else:
+                self.finished = []
+            if self.prune_running:
+                self._prune_running(run, res)
+
+    def _skip(self, run):
+        with self.batch._lock:
+            run._skipped = True
+        self.tracker.update(run.index, skipped=True)
+        self._summarize(run, 'skipped')
+
+    def _summarize(self, run, status, res=None):
+        summary = self.batch._summary
+        if summary.record:
+            summary.add(run, status, res)
+            summary.poll()
+
+    def _prune_running(self, finished, res):
+        """
+        Marks running runs ruled out by the prune predicate as cancelled.
+
+        """
+
+        for ind in self.inflight:
+            if ind not in self.cancelled and self.prune(self.batch.run[ind], finished, res):
+                self.cancelled.add(ind)
+
+    def sample(self, run, res):
+        """
+        Adds the runs proposed by the sampler for a finished run. Proposed runs
+        which are done already are passed to the sampler too.
+
+        """
+
+        finished = [(run, res)]
+        while len(finished) > 0:
+            run, res = finished.pop()
+            proposals = self.sampler(run, res)
+            if proposals is None:
+                continue
+
+            for proposal in proposals:
+                if isinstance(proposal, dict):
+                    runclass, parameters = type(run), proposal
+                else:
+                    runclass, parameters = proposal
+
+                new = runclass(self.batch, saveresult=self.batch._saveresult, **parameters)
+                if new.id in self.batch._ids:
+                    continue
+
+                self.batch._append(new)
+                if new.done or new._fetch_cache():
+                    finished.append((new, new.load()))
+                else:
+                    self.pending.append(new.index)
+                    self.tracker.total += 1
+
+    def close(self):
+        """
+        Resets the profiled runs and merges their profiles, removing the
+        profile files of the runs.
+
+        """
+
+        if len(self.profiled) > 0:
+            for run, filename in self.profiled:
+                run._profile = None
+            filenames = [filename for run, filename in self.profiled]
+            profiling.merge(filenames, os.path.join(self.profile_dir, '{}_runs.prof'.format(self.batch.name)))
+
+            # the profiles of the runs are only kept merged
+            for filename in filenames:
+                if os.path.isfile(filename):
+                    os.remove(filename)
+
+
+class _MemoryEstimator(object):
+    """
+    Estimates the memory used by runs
+
+    The estimate of the run class is used when available. Otherwise the peak
+    memory of the finished run of the same class with the fewest different
+    parameter values is used, or the default when no run of the class is
+    finished. Only peaks measured for a single run are used, see
+    :py:attr:`~batchpy.run.Run.telemetry`.
+
+    """
+
+    # the number of finished runs per class which are compared
+    size = 1000
+
+    def __init__(self, default=None):
+        self.default = default
+        self.observed = {}
+
+    def add(self, run):
+        telemetry = run._telemetry
+        if telemetry is None or telemetry.get('maxrss') is None or run.parameters is None:
+            return
+        # the peak memory of a worker which computed other runs before and
+        # could not be reset includes the memory of those runs
+        if not telemetry.get('maxrss_reset') and telemetry.get('task') != 0:
+            return
+
+        if type(run) not in self.observed:
+            self.observed[type(run)] = collections.deque(maxlen=self.size)
+        self.observed[type(run)].append((run.parameters, telemetry['maxrss']))
+
+    def __call__(self, run):
+        estimate = run.memory_estimate()
+        if estimate is not None:
+            return estimate
+
+        observed = self.observed.get(type(run))
+        if not observed:
+            return self.default
+
+        parameters = run.parameters
+        best = None
+        for other, memory in observed:
+            distance = sum(1 for key, val in parameters.items() if not _equal(other.get(key), val))
+            if best is None or distance < best[0] or (distance == best[0] and memory > best[1]):
+                best = (distance, memory)
+        return best[1]
+
+
 # helper functions
-def strlist(runs):
+def _hash_shard(id, n):
     """
-    Returns a pretty formatted string list with dots if there are too many
-    elements.
+    Returns the shard of a run id in n shards.
+
     """
-    if len(runs) > 5:
-        return '[' + str(runs[0]) + ',' + str(runs[1]) + ',...,' + str(runs[-2]) + ',' + str(runs[-1]) + ']'
-    else:
-        return str(runs)
+
+    return int(id[:15], 16) % n
+
+
+def _equal(a, b):
+    try:
+        return bool(a == b)
+    except Exception:
+        return a is b
 
 
-def print_progress(i, run_inds, starttime, runs, async=False, width=80, verbose=2):
+def run_async(index, run):
     """
-    Prints the progress of a set of runs
+    Computes a run in a worker process and returns the result.
+
     """
-    if async:
-        skipindex = len([1 for i in run_inds if runs[i].done])
-    else:
-        skipindex = i
-
-    if verbose > 1:
-        skip = 1
-    elif verbose > 0:
-        skip = int(np.ceil(len(run_inds) / 50.))
-    else:
-        skip = 1
-
-    if skipindex % skip == 0:
-        runtime = time.time() - starttime
-        if runtime > 3600:
-            runtime_str = '{0:.1f} h'.format(runtime / 3600)
-        else:
-            runtime_str = '{0:.1f} min'.format(runtime / 60)
+    try:
+        res, runtime = run._run()
+    except Exception:
+        return {'index': index, 'error': traceback.format_exc()}
+    return {'index': index, 'res': res, 'runtime': runtime, 'telemetry': run._telemetry}
 
-        if i == 0:
-            eta_str = '/'
-        else:
-            if async:
-                n_done = len([1 for i in run_inds if runs[i].done])
-                n_total = len(run_inds)
-            else:
-                n_done = i
-                n_total = len(run_inds)
-            eta = runtime / n_done * (n_total - n_done)
-            if eta > 3600:
-                eta_str = '{0:.1f} h'.format(eta / 3600)
-            else:
-                eta_str = '{0:.1f} min'.format(eta / 60)
 
-        progress_str = '### '
-        if async:
-            progress_str += 'finished '
-        progress_str += 'run {0} in '.format(run_inds[i])
+def _error_callback(results, index):
+    """
+    Returns a callback putting an error in a pool task of a run on a queue.
 
-        progress_str += strlist(run_inds)
-        progress_str += (40 - len(progress_str)) * ' '
-        progress_str += 'runtime: {}'.format(runtime_str)
-        progress_str += 4 * ' '
-        progress_str += 'eta: {}'.format(eta_str)
-        progress_str += (width - len(progress_str) - 3) * ' ' + '###'
+    """
 
-        print(progress_str)
-        sys.stdout.flush()
+    def callback(error):
+        message = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        results.put({'index': index, 'error': message})
+    return callback
 
 
-def run_async(i, run_inds, starttime, runs):
-    res, runtime = runs[run_inds[i]]._run()
-    return {'res': res, 'runtime': runtime, 'run_inds': run_inds, 'i': i, 'starttime': starttime}
+def clear_res(path='', threads=None):
+    """
+    Removes all files from the ``_res`` folder in a path.
 
+    Parameters
+    ----------
+    path : string, optional
+        The path of the ``_res`` folder, the path of the batch, defaults to the
+        current path.
+
+    threads : int, optional
+        The maximum number of threads used for removing files.
+
+    Returns
+    -------
+    report : dict
+        See :py:meth:`~batchpy.storage.remove_many`.
+
+    """
 
-def clear_res():
-    folder = '_res'
+    folder = os.path.join(path, '_res')
     try:
-        for file in os.listdir(folder):
-            file_path = os.path.join(folder, file)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-    except Exception as e:
+        filenames = [entry.path for entry in os.scandir(folder) if entry.is_file()]
+    except OSError as e:
         print(e)
+        return {'files': 0, 'size': 0, 'failed': []}
+    return storage.remove_many(filenames, threads=threads)
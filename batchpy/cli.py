@@ -0,0 +1,304 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+
+
+# The command line interface only imports the modules required by a command
+# when the command is executed. Only the run command builds the runs of a
+# batch, the other commands work on the results folder.
+
+
+def main(argv=None):
+    """
+    Runs the batchpy command line interface.
+
+    Parameters
+    ----------
+    argv : list of strings, optional
+        The command line arguments, defaults to :code:`sys.argv[1:]`.
+
+    Returns
+    -------
+    code : int
+        The exit code.
+
+    Examples
+    --------
+    .. code-block:: bash
+
+        python -m batchpy run mybatch.py --slice 3/100 --processes 4
+        python -m batchpy status mybatch
+        python -m batchpy collect mybatch --output mybatch.csv
+        python -m batchpy verify mybatch
+        python -m batchpy clean mybatch
+
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m batchpy', description='Run and inspect batchpy batches.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    sub = subparsers.add_parser('run', help='compute the runs of a batch defined in a python file')
+    sub.add_argument('file', help='a python file defining a batch')
+    sub.add_argument('--batch', default=None,
+                     help='the name or variable name of the batch when the file defines several batches')
+    sub.add_argument('--slice', default=None,
+                     help='compute only the i-th of n slices of the runs, formatted as i/n with 0 <= i < n')
+    sub.add_argument('--strategy', choices=['hash', 'round_robin', 'cost_balanced'], default='hash',
+                     help='the strategy used to assign runs to slices, see Batch.shard')
+    sub.add_argument('--processes', type=int, default=1, help='the number of processes')
+    sub.add_argument('--executor', choices=['pool', 'serial'], default='pool',
+                     help='compute runs in a pool of processes or serially in the current process')
+    sub.add_argument('--verbose', type=int, default=1, help='the amount of printed output 0/1/2')
+    sub.set_defaults(func=_run)
+
+    sub = subparsers.add_parser('status', help='print the number of done and pending runs')
+    _add_batch_arguments(sub)
+    sub.set_defaults(func=_status)
+
+    sub = subparsers.add_parser('collect', help='write the id, runtime and parameters of all results to a csv file')
+    _add_batch_arguments(sub)
+    sub.add_argument('--output', default=None, help='the output file, defaults to stdout')
+    sub.add_argument('--threads', type=int, default=None, help='the number of threads used to read metadata')
+    sub.set_defaults(func=_collect)
+
+    sub = subparsers.add_parser('verify', help='check that all result files can be loaded')
+    _add_batch_arguments(sub)
+    sub.add_argument('--threads', type=int, default=None, help='the number of threads used to read files')
+    sub.set_defaults(func=_verify)
+
+    sub = subparsers.add_parser('clean', help='remove temporary files and checkpoints of finished runs')
+    _add_batch_arguments(sub)
+    sub.add_argument('--checkpoints', action='store_true', help='also remove checkpoints of unfinished runs')
+    sub.add_argument('--dry-run', action='store_true', help='only print the files which would be removed')
+    sub.set_defaults(func=_clean)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    return args.func(args)
+
+
+def _add_batch_arguments(parser):
+    parser.add_argument('name', help='the name of the batch')
+    parser.add_argument('--path', default='', help='the path of the batch, the results are stored in path/_res')
+
+
+def _parse_slice(value):
+    """
+    Parses a slice formatted as ``i/n``.
+
+    """
+
+    try:
+        i, n = [int(v) for v in value.split('/')]
+    except ValueError:
+        raise ValueError('Slice \'{}\' not recognized, should be formatted as i/n.'.format(value))
+    if n < 1 or not 0 <= i < n:
+        raise ValueError('Slice \'{}\' not valid, should satisfy 0 <= i < n.'.format(value))
+    return i, n
+
+
+def _load_batch(filename, name=None):
+    """
+    Imports a python file as a module and returns the batch defined in it.
+
+    The file is imported under its own name, so run classes defined in it can
+    be pickled for worker processes. Code guarded by
+    ``if __name__ == '__main__':`` is not executed.
+
+    """
+
+    import importlib.util
+    from .batch import Batch
+
+    filename = os.path.abspath(filename)
+    modulename = os.path.splitext(os.path.basename(filename))[0]
+    sys.path.insert(0, os.path.dirname(filename))
+
+    spec = importlib.util.spec_from_file_location(modulename, filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[modulename] = module
+    spec.loader.exec_module(module)
+
+    batches = [(key, val) for key, val in vars(module).items() if isinstance(val, Batch)]
+    if name is not None:
+        batches = [(key, val) for key, val in batches if name in (key, val.name)]
+
+    if len(batches) == 0:
+        raise ValueError('No batch found in \'{}\'.'.format(filename))
+    if len(batches) > 1:
+        raise ValueError('Several batches found in \'{}\', select one with --batch.'.format(filename))
+
+    return batches[0][1]
+
+
+def _run(args):
+    batch = _load_batch(args.file, args.batch)
+
+    if args.slice is None:
+        runs = list(range(len(batch.run)))
+    else:
+        i, n = _parse_slice(args.slice)
+        runs = batch.shard(i, n, strategy=args.strategy)
+
+    # the ids are saved once, for the status command
+    if args.slice is None or i == 0:
+        batch.save_ids(format='bin')
+
+    processes = 1 if args.executor == 'serial' else args.processes
+    batch(runs=runs, verbose=args.verbose, processes=processes)
+    return 0
+
+
+def _status(args):
+    from . import storage
+
+    savepath = os.path.join(args.path, '_res')
+    files = storage.result_files(savepath, args.name)
+
+    idsfilenames = [os.path.join(savepath, '{}_ids.{}'.format(args.name, format)) for format in ['bin', 'npy']]
+    idsfilenames = [filename for filename in idsfilenames if os.path.isfile(filename)]
+    if len(idsfilenames) > 0:
+        ids = storage.load_ids(idsfilenames[0])
+        if not isinstance(ids, list):
+            ids = storage.hexdigests(ids)
+        done = sum(1 for id in ids if id in files)
+        print('{}: {} runs, {} done, {} pending'.format(args.name, len(ids), done, len(ids) - done))
+    else:
+        print('{}: {} done, no saved ids to determine the pending runs'.format(args.name, len(files)))
+    return 0
+
+
+def _collect(args):
+    import csv
+    from . import storage
+
+    files = storage.result_files(os.path.join(args.path, '_res'), args.name)
+    ids = sorted(files.keys())
+    metadata = storage.load_metadata_many([files[id] for id in ids], threads=args.threads)
+
+    keys = []
+    for data in metadata:
+        if data is not None:
+            for key in data.get('parameters', {}):
+                if key not in keys:
+                    keys.append(key)
+
+    if args.output is None:
+        f = sys.stdout
+    else:
+        f = open(args.output, 'w', newline='')
+    try:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'runtime'] + keys)
+        for id, data in zip(ids, metadata):
+            if data is not None:
+                parameters = data.get('parameters', {})
+                writer.writerow([id, data.get('runtime')] + [parameters.get(key) for key in keys])
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return 0
+
+
+def _verify(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from . import storage
+
+    files = storage.result_files(os.path.join(args.path, '_res'), args.name)
+    ids = sorted(files.keys())
+
+    def verify(id):
+        try:
+            metadata = storage.load_metadata(files[id])
+            data = storage.load(files[id])
+        except Exception as e:
+            return '{}: {}'.format(id, e)
+        if metadata is None or not isinstance(data, dict) or 'res' not in data:
+            return '{}: no run data'.format(id)
+        if metadata.get('id', id) != id:
+            return '{}: the file contains run {}'.format(id, metadata['id'])
+        return None
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        errors = [error for error in executor.map(verify, ids) if error is not None]
+
+    for error in errors:
+        print(error)
+    print('{}: {} results verified, {} errors'.format(args.name, len(ids), len(errors)))
+    return 1 if len(errors) > 0 else 0
+
+
+def _clean(args):
+    from . import storage
+
+    savepath = os.path.join(args.path, '_res')
+    files = storage.result_files(savepath, args.name)
+
+    remove = []
+    if os.path.isdir(savepath):
+        for entry in os.scandir(savepath):
+            parsed = storage.parse_filename(entry.name, args.name)
+            if parsed is None or not entry.is_file():
+                continue
+            id, extension = parsed
+            parts = extension.split('.')
+            if len(parts) == 4 and parts[1] in ('npy', 'ckpt') and parts[2].isdigit() and parts[3] == 'tmp':
+                # files left by interrupted saves, files of running processes
+                # are kept
+                if not _alive(int(parts[2])) or time.time() - entry.stat().st_mtime > _tmp_age:
+                    remove.append(entry.path)
+            elif extension == '.ckpt':
+                if args.checkpoints or id in files:
+                    remove.append(entry.path)
+
+    for filename in remove:
+        print(filename)
+        if not args.dry_run:
+            os.remove(filename)
+    print('{}: {} files {}'.format(args.name, len(remove), 'to remove' if args.dry_run else 'removed'))
+    return 0
+
+
+def _alive(pid):
+    """
+    Returns :code:`False` when a process with the pid surely does not exist.
+
+    """
+
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# seconds after which temporary files are removed even when the process which
+# wrote them is alive, for instance on another host
+_tmp_age = 24 * 3600.
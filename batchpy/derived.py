@@ -0,0 +1,244 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import hashlib
+import importlib
+
+import numpy as np
+
+from . import storage
+from .run import _hash_code
+
+
+class Derived(object):
+    """
+    A quantity derived from the results of the runs of a batch
+
+    The values are memoized on disk in a table with a row per run id, in a
+    folder named after the batch in the ``_derived`` folder in the results
+    folder. The filename contains a hash of the code of the function, when the
+    function changes all values are computed again.
+
+    Derived quantities should not be created directly but through
+    :py:meth:`~batchpy.batch.Batch.derived`.
+
+    When pickled, a derived quantity is replaced by its function, looked up by
+    name like functions are, so the function can be passed to worker processes
+    also when the derived quantity replaced it in its module as a decorator.
+
+    """
+
+    def __init__(self, batch, func, name=None):
+        self.batch = batch
+        self.func = func
+        self.name = func.__name__ if name is None else name
+
+        h = hashlib.sha1()
+        _hash_code(func, h)
+        self.code_hash = h.hexdigest()
+
+    def __reduce__(self):
+        return _resolve, (self.func.__module__, self.func.__qualname__)
+
+    @property
+    def filename(self):
+        """
+        Property returning the filename of the memoized values.
+
+        """
+
+        return os.path.join(_folder(self.batch.savepath, self.batch.name),
+                            '{}_{}.npz'.format(self.name, self.code_hash[:10]))
+
+    def __call__(self, runs=None, processes=1):
+        """
+        Returns the derived quantity of runs, computing the values which are
+        not memoized yet.
+
+        Parameters
+        ----------
+        runs : list of ints, optional
+            Indices of the runs, defaults to all runs.
+
+        processes : int, optional
+            Number of processes used to load results and compute missing
+            values. The function must be picklable when more than 1.
+
+        Returns
+        -------
+        values : numpy array
+            The values in the order of the runs, ``nan`` for runs which are
+            not done.
+
+        """
+
+        allruns = self.batch._runs()
+        if runs is None:
+            runs = range(len(allruns))
+        runs = [allruns[ind] for ind in runs]
+
+        memo = self.load()
+        missing = [run for run in runs if run.id not in memo and run.done]
+        if len(missing) > 0:
+            saved = [run for run in missing if run._saveresult]
+            if processes > 1 and len(saved) > 1:
+                from multiprocessing import Pool
+                with Pool(processes=processes) as pool:
+                    values = pool.starmap(_apply, [(self, run.filename) for run in saved])
+            else:
+                values = [_apply(self.func, run.filename) for run in saved]
+            memo.update(zip([run.id for run in saved], values))
+
+            # results which are not saved are only available in this process
+            for run in missing:
+                if not run._saveresult and run._result is not None:
+                    memo[run.id] = self.func(run._result)
+
+            self.save(memo)
+
+        return _column([memo.get(run.id, np.nan) for run in runs])
+
+    def load(self):
+        """
+        Loads the memoized values.
+
+        Returns
+        -------
+        memo : dict
+            A dictionary of values by run id.
+
+        """
+
+        if not os.path.isfile(self.filename):
+            return {}
+        with np.load(self.filename, allow_pickle=True) as data:
+            return dict(zip([str(id) for id in data['id']], data['value']))
+
+    def save(self, memo):
+        """
+        Saves memoized values.
+
+        Parameters
+        ----------
+        memo : dict
+            A dictionary of values by run id.
+
+        """
+
+        dirname = os.path.dirname(self.filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, exist_ok=True)
+
+        ids = sorted(memo.keys())
+        tempfilename = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(tempfilename, 'wb') as f:
+            np.savez(f, id=np.array(ids, dtype='U40'), value=_column([memo[id] for id in ids]))
+        os.replace(tempfilename, self.filename)
+
+
+def invalidate(savepath, name, ids):
+    """
+    Removes the memoized values of runs of a batch for all derived quantities,
+    for instance when their results are removed.
+
+    Parameters
+    ----------
+    savepath : string
+        The results folder.
+
+    name : string
+        The name of the batch.
+
+    ids : iterable of strings
+        The ids of the runs.
+
+    """
+
+    ids = set(ids)
+    folder = _folder(savepath, name)
+    if len(ids) == 0 or not os.path.isdir(folder):
+        return
+
+    for entry in os.scandir(folder):
+        if not entry.name.endswith('.npz'):
+            continue
+        with np.load(entry.path, allow_pickle=True) as data:
+            memoids = data['id']
+            values = data['value']
+        keep = np.array([str(id) not in ids for id in memoids], dtype=bool)
+        if not keep.all():
+            tempfilename = '{}.{}.tmp'.format(entry.path, os.getpid())
+            with open(tempfilename, 'wb') as f:
+                np.savez(f, id=memoids[keep], value=values[keep])
+            os.replace(tempfilename, entry.path)
+
+
+def _folder(savepath, name):
+    """
+    Returns the folder with the memoized values of a batch, a folder per batch
+    keeps the files of batches apart regardless of their names.
+
+    """
+
+    return os.path.join(savepath, '_derived', name)
+
+
+def _resolve(module, qualname):
+    """
+    Returns the function of a derived quantity from its module.
+
+    """
+
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    if isinstance(obj, Derived):
+        obj = obj.func
+    return obj
+
+
+def _apply(func, filename):
+    """
+    Applies a function to the result in a file.
+
+    """
+
+    data = storage.load(filename)
+    if data is None:
+        return np.nan
+    return func(data['res'])
+
+
+def _column(values):
+    """
+    Returns values as a numpy array, an object array when the values are not
+    scalars of a single type.
+
+    """
+
+    try:
+        column = np.array(values)
+    except ValueError:
+        column = None
+    if column is None or column.ndim != 1:
+        column = np.empty(len(values), dtype=object)
+        for i, val in enumerate(values):
+            column[i] = val
+    return column
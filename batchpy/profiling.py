@@ -0,0 +1,112 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+
+
+PROFILE_MODES = (None, 'runs', 'dispatch', 'both')
+
+# the profiler enabled by profile in this process
+_active = None
+
+
+def profile(func, filename, *args, **kwargs):
+    """
+    Calls a function with the cProfile profiler enabled and writes the stats
+    to a file.
+
+    Only one profiler can be active at a time. When profile is called from a
+    profiled function, the outer profiler is paused while the inner function
+    is profiled.
+
+    Parameters
+    ----------
+    func : callable
+        The function to profile.
+
+    filename : string
+        The file to write the profile stats to.
+
+    *args, **kwargs :
+        Arguments passed to the function.
+
+    Returns
+    -------
+    res : anything
+        The return value of the function.
+
+    """
+
+    import cProfile
+    global _active
+
+    outer = _active
+    if outer is not None:
+        outer.disable()
+
+    profiler = cProfile.Profile()
+    _active = profiler
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _active = outer
+        profiler.dump_stats(filename)
+        if outer is not None:
+            outer.enable()
+
+
+def merge(filenames, filename):
+    """
+    Merges profile stats files into a single file.
+
+    Parameters
+    ----------
+    filenames : list of strings
+        The profile stats files to merge, files which do not exist are
+        skipped.
+
+    filename : string
+        The file to write the merged stats to.
+
+    Returns
+    -------
+    filename : string, :code:`None`
+        The merged stats filename or :code:`None` when there was nothing to
+        merge.
+
+    Examples
+    --------
+    >>> filename = batchpy.profiling.merge(['a.prof', 'b.prof'], 'merged.prof')
+    >>> pstats.Stats(filename).sort_stats('cumulative').print_stats(10)
+
+    """
+
+    import pstats
+
+    filenames = [f for f in filenames if os.path.isfile(f)]
+    if len(filenames) == 0:
+        return None
+
+    stats = pstats.Stats(filenames[0])
+    for f in filenames[1:]:
+        stats.add(f)
+    stats.dump_stats(filename)
+    return filename
@@ -0,0 +1,249 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import sys
+import time
+import logging
+import threading
+import collections
+
+
+ProgressState = collections.namedtuple('ProgressState',
+                                       ['done', 'failed', 'skipped', 'total', 'last', 'elapsed', 'rate', 'eta'])
+
+
+class Progress(object):
+    """
+    Tracks the progress of a set of runs
+
+    Updating the progress only increments counters. The progress state is
+    passed to the sinks by :py:meth:`~batchpy.progress.Progress.poll` at most
+    once per interval, which keeps the cost per finished run constant.
+
+    Updating the progress and retrieving the state are thread safe.
+
+    """
+
+    def __init__(self, total, sinks=None, interval=1.0, smoothing=0.3):
+        """
+        Creates a progress tracker
+
+        Parameters
+        ----------
+        total : int
+            The total number of runs.
+
+        sinks : callable or list of callables, optional
+            Callables which are called with a
+            :py:class:`~batchpy.progress.ProgressState` when the progress is
+            rendered.
+
+        interval : number, optional
+            The minimum time in seconds between two renders.
+
+        smoothing : number, optional
+            The weight of the most recent throughput measurement in the
+            exponentially weighted throughput used to compute the eta.
+
+        Examples
+        --------
+        >>> progress = batchpy.Progress(10, sinks=[batchpy.TerminalSink()])
+        >>> progress.update(0)
+        >>> progress.poll()
+
+        """
+
+        if sinks is None:
+            sinks = []
+        elif callable(sinks):
+            sinks = [sinks]
+
+        self.total = total
+        self.sinks = list(sinks)
+        self.interval = interval
+        self.smoothing = smoothing
+
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.last = None
+
+        self._starttime = time.monotonic()
+        self._lastrender = None
+        self._sampletime = self._starttime
+        self._sampledone = 0
+        self._rate = None
+        self._lock = threading.Lock()
+
+    def update(self, index=None, failed=False, skipped=False):
+        """
+        Registers a finished run, does not perform any I/O.
+
+        Parameters
+        ----------
+        index : int, optional
+            The index of the finished run.
+
+        failed : bool, optional
+            If the run failed or not.
+
+        skipped : bool, optional
+            If the run was skipped or not.
+
+        """
+
+        with self._lock:
+            self.done += 1
+            if failed:
+                self.failed += 1
+            if skipped:
+                self.skipped += 1
+            self.last = index
+
+    def poll(self, force=False):
+        """
+        Renders the progress to all sinks when the interval has passed since
+        the last render.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Render regardless of the interval.
+
+        """
+
+        now = time.monotonic()
+        if not force and self._lastrender is not None and now - self._lastrender < self.interval:
+            return
+
+        self._lastrender = now
+        state = self.state(now)
+        for sink in self.sinks:
+            sink(state)
+
+    def state(self, now=None):
+        """
+        Returns the current progress state.
+
+        Returns
+        -------
+        state : :py:class:`~batchpy.progress.ProgressState`
+            The progress state.
+
+        """
+
+        with self._lock:
+            if now is None:
+                now = time.monotonic()
+
+            # update the exponentially weighted throughput
+            if now > self._sampletime and self.done > self._sampledone:
+                rate = (self.done - self._sampledone) / (now - self._sampletime)
+                if self._rate is None:
+                    self._rate = rate
+                else:
+                    self._rate = self.smoothing * rate + (1 - self.smoothing) * self._rate
+                self._sampletime = now
+                self._sampledone = self.done
+
+            if self._rate is None or self._rate <= 0:
+                eta = None
+            else:
+                eta = (self.total - self.done) / self._rate
+
+            return ProgressState(done=self.done, failed=self.failed, skipped=self.skipped, total=self.total,
+                                 last=self.last, elapsed=now - self._starttime, rate=self._rate, eta=eta)
+
+
+class TerminalSink(object):
+    """
+    A progress sink writing a single line per render to a stream
+
+    Parameters
+    ----------
+    stream : file object, optional
+        The stream to write to, defaults to :code:`sys.stdout`.
+
+    width : int, optional
+        The width of the progress line.
+
+    """
+
+    def __init__(self, stream=None, width=80):
+        self.stream = stream
+        self.width = width
+
+    def __call__(self, state):
+        stream = self.stream
+        if stream is None:
+            stream = sys.stdout
+
+        progress_str = '### {}/{} runs'.format(state.done, state.total)
+        if state.failed > 0:
+            progress_str += ' ({} failed)'.format(state.failed)
+        if state.skipped > 0:
+            progress_str += ' ({} skipped)'.format(state.skipped)
+        progress_str += (40 - len(progress_str)) * ' '
+        progress_str += 'runtime: {}'.format(format_duration(state.elapsed))
+        progress_str += 4 * ' '
+        progress_str += 'eta: {}'.format(format_duration(state.eta))
+        progress_str += (self.width - len(progress_str) - 3) * ' ' + '###'
+
+        stream.write(progress_str + '\n')
+        stream.flush()
+
+
+class LogSink(object):
+    """
+    A progress sink writing to a logger
+
+    Parameters
+    ----------
+    logger : :code:`logging.Logger`, optional
+        The logger to write to, defaults to the ``batchpy`` logger.
+
+    level : int, optional
+        The logging level.
+
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        if logger is None:
+            logger = logging.getLogger('batchpy')
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, state):
+        self.logger.log(self.level, '%s/%s runs done, %s failed, %s skipped, runtime: %s, eta: %s',
+                        state.done, state.total, state.failed, state.skipped,
+                        format_duration(state.elapsed), format_duration(state.eta))
+
+
+def format_duration(duration):
+    """
+    Returns a duration in seconds as a string in minutes or hours.
+
+    """
+
+    if duration is None:
+        return '/'
+    elif duration > 3600:
+        return '{0:.1f} h'.format(duration / 3600)
+    else:
+        return '{0:.1f} min'.format(duration / 60)
@@ -18,12 +18,30 @@
 ################################################################################
 
 import os
+import sys
 import hashlib
 import types
-import inspect
 import time
 
-import numpy as np
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from . import storage
+from . import profiling
+
+
+# objects which persist across runs computed in the same process and the run
+# classes which were set up in this process
+_worker_cache = {}
+_worker_setup = set()
+
+# tuples of parameter names, shared by all runs with the same parameter names
+_parameter_keys = {}
+
+# the number of runs computed with telemetry in this process
+_computed = 0
 
 
 class Run(object):
@@ -36,8 +54,18 @@ class Run(object):
     be redefined to actually run the wanted computations and return the result
     as a dictionary.
 
+    The state of a run is kept in slots and the parameter values in a tuple.
+    A subclass without its own :code:`__slots__` still gets an instance
+    dictionary, user defined classes must declare :code:`__slots__ = ()` to
+    keep the memory used by very large batches low. Classes which set
+    attributes of their own can list them in :code:`__slots__` or leave it out.
+
     """
 
+    __slots__ = ('batch', '_id', '_index', '_done', '_skipped', '_runtime', '_saveresult', '_result', '_telemetry',
+                 '_checkpoint_time', '_profile', '_resultonly', '_parameter_keys', '_parameter_values',
+                 '_private_parameters')
+
     def __init__(self, batch, saveresult=True, **parameters):
         """
         Creates a batchpy run
@@ -77,39 +105,96 @@ class Run(object):
 
         self.batch = batch
         self._id = None
+        self._index = None
         self._done = False
+        self._skipped = False
         self._runtime = None
         self._saveresult = saveresult
         self._result = None
+        self._telemetry = None
+        self._checkpoint_time = None
+        # filename to write a profile of the computation to, set by the batch
+        self._profile = None
 
         # get the parameters from the run function
         self._resultonly = False
-        self._parameters = {}
-        self._private_parameters = {}
-        try:
-            a = inspect.signature(self.run)
-            for n, p in a.parameters.items():
-                if p.name.startswith('_'):
-                    self._private_parameters[p.name] = p.default
-                else:
-                    self._parameters[p.name] = p.default
-        except:
-            a = inspect.getargspec(self.run)
-            for key, val in zip(a.args[-len(a.defaults):], a.defaults):
-                if key.startswith('_'):
-                    self._private_parameters[key] = val
-                else:
-                    self._parameters[key] = val
+        defaults, private_defaults = self._parameter_defaults()
+        values = dict(defaults)
+
+        # runs without private parameters share the defaults, they are never
+        # modified
+        private = {key: val for key, val in parameters.items() if key.startswith('_')}
+        if len(private) > 0:
+            self._private_parameters = dict(private_defaults, **private)
+        else:
+            self._private_parameters = private_defaults
 
         for key, val in parameters.items():
-            if key.startswith('_'):
-                self._private_parameters[key] = val
-            else:
-                self._parameters[key] = val
+            if not key.startswith('_'):
+                values[key] = val
+
+        keys = tuple(values.keys())
+        self._parameter_keys = _parameter_keys.setdefault(keys, keys)
+        self._parameter_values = tuple(values.values())
 
-        self._id = self.generate_id(self._parameters)
+        self._id = self.generate_id(values)
         self._check_result()
 
+    @classmethod
+    def _parameter_defaults(cls):
+        """
+        Returns dictionaries with the default values of the public and private
+        parameters of the run method, inspected once per class.
+
+        """
+
+        if '_defaults' not in cls.__dict__:
+            import inspect
+
+            defaults = {}
+            private_defaults = {}
+            try:
+                a = inspect.signature(cls.run)
+                # skip self
+                for n, p in list(a.parameters.items())[1:]:
+                    if p.name.startswith('_'):
+                        private_defaults[p.name] = p.default
+                    else:
+                        defaults[p.name] = p.default
+            except:
+                a = inspect.getargspec(cls.run)
+                for key, val in zip(a.args[-len(a.defaults):], a.defaults):
+                    if key.startswith('_'):
+                        private_defaults[key] = val
+                    else:
+                        defaults[key] = val
+            cls._defaults = (defaults, private_defaults)
+
+        return cls._defaults
+
+    @classmethod
+    def parameter_id(cls, parameters):
+        """
+        Returns the id a run of this class would get from the parameters,
+        without creating the run.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters supplied to the run, default values are added.
+
+        Returns
+        -------
+        id : string
+            the id hash
+
+        """
+
+        run = cls.__new__(cls)
+        parameters = dict(cls._parameter_defaults()[0],
+                          **{key: val for key, val in parameters.items() if not key.startswith('_')})
+        return run.generate_id(parameters)
+
     def run(self):
         """
         Perform calculations and return the result
@@ -139,10 +224,127 @@ class Run(object):
         """
         return {}
 
+    #: A user defined version of the run method. It is part of the key of
+    #: results in a shared cache and should be changed when the computations
+    #: change.
+    version = None
+
+    #: Include the run class name and a hash of the code of the run method
+    #: and its dependencies in the run id. When the code changes, the ids of
+    #: the runs of this class change and the runs are recomputed.
+    versioned = False
+
+    #: Functions, classes or modules used by the run method whose code is
+    #: included in the code hash.
+    dependencies = ()
+
+    @classmethod
+    def setup_worker(cls):
+        """
+        Prepares a process for computing runs of this class
+
+        This method can be overwritten in a user defined child class to do
+        expensive work which is common to all runs, like importing heavy
+        modules or loading a model, once per process instead of once per run.
+        It is called before the first run of the class is computed in a
+        process, or when the process is started if the batch is called with
+        :code:`warmup=True`. Objects which should be available to the runs can
+        be stored in the :py:meth:`~batchpy.run.Run.worker_cache`.
+
+        The time spent in this method is not included in the run runtime.
+
+        Examples
+        --------
+        >>> class Myrun(batchpy.Run):
+        ...     @classmethod
+        ...     def setup_worker(cls):
+        ...         cls.worker_cache()['model'] = load_model('model.pkl')
+        ...
+        ...     def run(self, mypar=5):
+        ...         return {'val': self.worker_cache()['model'].predict(mypar)}
+        ...
+
+        """
+        pass
+
+    @staticmethod
+    def worker_cache():
+        """
+        Returns a dictionary which persists across runs computed in the same
+        process.
+
+        Returns
+        -------
+        cache : dict
+            The cache of the current process.
+
+        """
+
+        return _worker_cache
+
+    def memory_estimate(self):
+        """
+        Returns an estimate of the memory used by the computation of the run
+
+        This method can be overwritten in a user defined child class to supply
+        the estimates used when the batch is called with a memory budget. When
+        it returns :code:`None`, the memory is estimated from the telemetry of
+        finished runs.
+
+        Returns
+        -------
+        memory : number, :code:`None`
+            The estimated peak memory of the run in bytes.
+
+        Examples
+        --------
+        >>> class Myrun(batchpy.Run):
+        ...     def memory_estimate(self):
+        ...         return 8 * self.parameters['size']**2
+        ...
+        ...     def run(self, size=1000):
+        ...         return {'val': np.ones((size, size)).sum()}
+        ...
+
+        """
+        return None
+
     def _run(self):
-        t_start = time.time()
+        if type(self) not in _worker_setup:
+            setup_worker([type(self)])
+        if self._profile is not None:
+            return profiling.profile(self._compute, self._profile)
+        return self._compute()
+
+    def _compute(self):
+        if not self.batch._telemetry:
+            t_start = time.monotonic()
+            res = self.run(**self.parameters, **self._private_parameters)
+            t_end = time.monotonic()
+            return res, t_end - t_start
+
+        global _computed
+
+        # the peak memory is reset so it is measured for this run only
+        reset = _reset_maxrss()
+        t_start = time.monotonic()
+        c_start = time.process_time()
         res = self.run(**self.parameters, **self._private_parameters)
-        t_end = time.time()
+        c_end = time.process_time()
+        t_end = time.monotonic()
+
+        import multiprocessing
+
+        self._telemetry = {
+            'wall': t_end - t_start,
+            'cpu': c_end - c_start,
+            'maxrss': _maxrss(),
+            'maxrss_reset': reset,
+            'task': _computed,
+            'worker': multiprocessing.current_process().name,
+            'pid': os.getpid(),
+        }
+        _computed += 1
         return res, t_end - t_start
 
     def __call__(self):
@@ -162,6 +364,9 @@ class Run(object):
         The computation is timed and the runtime is saved in the :code:`runtime`
         attribute.
 
+        When the batch has a shared cache, the result is taken from the cache
+        if available and stored in the cache after the computation otherwise.
+
         Returns
         -------
         res : anything
@@ -175,13 +380,15 @@ class Run(object):
         {'val': 10}
 
         """
-        if not self._done:
+        if not self._done and not self._fetch_cache():
             res, runtime = self._run()
             self._runtime = runtime
             if self._saveresult:
                 self._save(res)
+                self._store_cache()
             else:
                 self._result = res
+            self._remove_checkpoint()
             self._done = True
         else:
             res = self.load()
@@ -244,9 +451,75 @@ class Run(object):
             os.remove(self.filename)
             self._done = False
             return True
-        except:
+        except OSError:
             return False
 
+    def checkpoint(self, state, interval=None):
+        """
+        Saves the state of a computation to disk
+
+        This method can be used inside the :py:meth:`~batchpy.run.Run.run`
+        method of long runs to save intermediate states. When the computation is
+        interrupted and the batch is restarted, the last state can be retrieved
+        with :py:meth:`~batchpy.run.Run.restore`. The checkpoint is removed when
+        the result is saved.
+
+        Parameters
+        ----------
+        state : anything
+            The state to save, must be picklable.
+
+        interval : number, optional
+            When supplied, the state is only saved if the last checkpoint was
+            saved more than interval seconds ago.
+
+        Returns
+        -------
+        saved : bool
+            :code:`True` if the checkpoint was saved.
+
+        Examples
+        --------
+        >>> class Myrun(batchpy.Run):
+        ...     def run(self, steps=1000):
+        ...         step, val = self.restore(default=(0, 0.))
+        ...         for step in range(step, steps):
+        ...             val += some_long_computation(step)
+        ...             self.checkpoint((step + 1, val), interval=600)
+        ...         return {'val': val}
+        ...
+
+        """
+
+        now = time.monotonic()
+        if interval is not None and self._checkpoint_time is not None and now - self._checkpoint_time < interval:
+            return False
+
+        storage.save(self.checkpointfilename, {'state': state}, {'id': self._id})
+        self._checkpoint_time = now
+        return True
+
+    def restore(self, default=None):
+        """
+        Returns the state saved with the last checkpoint
+
+        Parameters
+        ----------
+        default : anything, optional
+            The value returned when there is no checkpoint.
+
+        Returns
+        -------
+        state : anything
+            The saved state or the default.
+
+        """
+
+        data = storage.load(self.checkpointfilename)
+        if data is None:
+            return default
+        return data['state']
+
     @property
     def id(self):
         """
@@ -259,11 +532,11 @@ class Run(object):
     @property
     def parameters(self):
         """
-        Property returning the run parameters.
+        Property returning a dictionary with the run parameters.
 
         """
 
-        return self._parameters
+        return dict(zip(self._parameter_keys, self._parameter_values))
 
     @property
     def result(self):
@@ -287,6 +560,16 @@ class Run(object):
     def done(self, value):
         self._done = value
 
+    @property
+    def skipped(self):
+        """
+        Property returning if the run was skipped by pruning during the last
+        batch call.
+
+        """
+
+        return self._skipped
+
     @property
     def runtime(self):
         """
@@ -296,12 +579,41 @@ class Run(object):
 
         return self._runtime
 
+    @property
+    def telemetry(self):
+        """
+        Property returning the telemetry of a run or :code:`None` when the run
+        was computed without telemetry.
+
+        The telemetry is a dictionary with the wall time (``wall``), process cpu
+        time (``cpu``) of the computation, the peak resident set size in bytes
+        (``maxrss``), the time spent serializing (``serialize``) and writing
+        (``save``) the result, the size of the serialized result in bytes
+        (``size``), the name (``worker``) and process id (``pid``) of the
+        worker and the number of runs computed before by the worker process
+        (``task``).
+
+        The peak resident set size is the peak of the worker process during
+        the run when it can be reset before the run (``maxrss_reset``), which
+        requires Linux 4.0 or later. Otherwise it is the peak over the life of
+        the worker process, which includes earlier runs computed by the same
+        worker. Memory in use by the worker at the start of the run is always
+        included.
+
+        """
+
+        return self._telemetry
+
     @property
     def index(self):
         """
         Property returning the run index in its batch.
 
         """
+        if self._index is not None:
+            # the batch of a run computed in another process holds no runs
+            if self._index >= len(self.batch.run) or self.batch.run[self._index] is self:
+                return self._index
         return self.batch.run.index(self)
 
     @property
@@ -312,6 +624,46 @@ class Run(object):
         """
         return os.path.join(self.batch.savepath, '{}_{}.npy'.format(self.batch.name, self._id))
 
+    @property
+    def checkpointfilename(self):
+        """
+        Property returning the filename of the run checkpoint.
+
+        """
+        return os.path.join(self.batch.savepath, '{}_{}.ckpt'.format(self.batch.name, self._id))
+
+    @property
+    def cachefilename(self):
+        """
+        Property returning the filename of the run in the shared cache of the
+        batch or :code:`None` if the batch has no cache.
+
+        """
+        if self.batch._cache is None:
+            return None
+        return os.path.join(self.batch._cache, '{}.npy'.format(self.cache_key()))
+
+    def cache_key(self):
+        """
+        Generates the key of the run in a shared cache.
+
+        The key is a hash of the module and name of the run class, the run
+        :code:`version`, the :py:meth:`~batchpy.run.Run.code_hash` and the run
+        id. Runs with the same key are assumed to produce the same result,
+        regardless of the batch they belong to. Changing the code of the run
+        method or its dependencies thus invalidates cached results.
+
+        Returns
+        -------
+        key : string
+            the cache key of this run
+
+        """
+
+        key = '{}.{}:{}:{}:{}'.format(type(self).__module__, type(self).__qualname__, self.version,
+                                      self.code_hash(), self._id)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
     def generate_id(self, parameters):
         """
         Generates an id hash from the parameters.
@@ -339,6 +691,9 @@ class Run(object):
         be different each time python starts as the object resides in a
         different memory location.
 
+        When the run class is :code:`versioned`, the class name and the
+        :py:meth:`~batchpy.run.Run.code_hash` are included in the id.
+
         Examples
         --------
         >>> run.generate_id(run.parameters)
@@ -349,6 +704,10 @@ class Run(object):
         id_dict = {key: self._serialize(val) for key, val in parameters.items() if
                    not self._serialize(val) == '__unhashable__'}
 
+        if self.versioned:
+            id_dict['__class__'] = type(self).__qualname__
+            id_dict['__code__'] = self.code_hash()
+
         try:
             id = hashlib.sha1(str(sorted([str(id_dict[key]) for key in id_dict.keys()]))).hexdigest()
         except:
@@ -356,7 +715,42 @@ class Run(object):
 
         return id
 
-    def _save(self, res):
+    @classmethod
+    def code_hash(cls):
+        """
+        Returns a hash of the code of the run method and the dependencies.
+
+        The hash is computed from the bytecode, constants and names of the
+        code objects, it does not change when python is restarted. It is
+        computed once per class.
+
+        Returns
+        -------
+        hash : string
+            the code hash of the run class
+
+        Examples
+        --------
+        >>> class Myrun(batchpy.Run):
+        ...     versioned = True
+        ...     dependencies = (mymodule.myfunction,)
+        ...     def run(self, mypar=5):
+        ...         return {'val': 2*mypar}
+        ...
+        >>> hash = Myrun.code_hash()
+
+        """
+
+        if '_code_hash' not in cls.__dict__:
+            h = hashlib.sha1()
+            _hash_code(cls.run, h)
+            for dependency in cls.dependencies:
+                _hash_code(dependency, h)
+            cls._code_hash = h.hexdigest()
+
+        return cls._code_hash
+
+    def _save(self, res, runtime=None, telemetry=None):
         """
         Saves the result in res along with run identifiers.
 
@@ -365,10 +759,80 @@ class Run(object):
         res : dict
             The result dictionary
 
+        runtime : number, optional
+            The runtime stored with the result, the runtime of the run by
+            default.
+
+        telemetry : dict, optional
+            The telemetry stored with the result, the telemetry of the run by
+            default.
+
         """
 
+        if runtime is None:
+            runtime = self._runtime
+        if telemetry is None:
+            telemetry = self._telemetry
+
         parameters = {key: self._serialize(val) for key, val in self.parameters.items()}
-        np.save(self.filename, {'res': res, 'id': self._id, 'runtime': self._runtime, 'parameters': parameters})
+        metadata = {'id': self._id, 'runtime': runtime, 'parameters': parameters,
+                    'code': {'class': type(self).__qualname__, 'hash': self.code_hash()}}
+        data = dict(metadata, res=res)
+        storage.save(self.filename, data, metadata, telemetry=telemetry)
+
+    def _remove_checkpoint(self):
+        """
+        Removes the checkpoint of a completed run, so it is not restored when
+        the run is computed again, for instance when its result is not saved.
+
+        """
+
+        try:
+            os.remove(self.checkpointfilename)
+        except FileNotFoundError:
+            pass
+
+    def _fetch_cache(self):
+        """
+        Makes the result available from the shared cache if it is present
+        there.
+
+        Returns
+        -------
+        found : bool
+            :code:`True` if the result was found in the cache.
+
+        """
+
+        filename = self.cachefilename
+        if filename is None or not os.path.isfile(filename):
+            return False
+
+        if self._saveresult:
+            storage.link(filename, self.filename)
+            data = storage.load_metadata(filename)
+        else:
+            data = storage.load(filename)
+            self._result = data['res']
+
+        if data is not None:
+            self._runtime = data.get('runtime')
+        self._done = True
+        return True
+
+    def _store_cache(self):
+        """
+        Adds the saved result to the shared cache.
+
+        """
+
+        filename = self.cachefilename
+        if filename is None or os.path.isfile(filename):
+            return
+
+        if not os.path.isdir(self.batch._cache):
+            os.makedirs(self.batch._cache, exist_ok=True)
+        storage.link(self.filename, filename)
 
     def _load(self):
         """
@@ -377,11 +841,17 @@ class Run(object):
 
         """
 
-        data = None
-        if os.path.isfile(self.filename):
-            data = np.load(self.filename).item()
+        return storage.load(self.filename)
+
+    def _load_metadata(self):
+        """
+        Loads the metadata (id, runtime, parameters) from the file with the
+        correct id without loading the result, returns None if the file does
+        not exist.
+
+        """
 
-        return data
+        return storage.load_metadata(self.filename)
 
     def _serialize(self, val):
         """
@@ -454,8 +924,12 @@ class Run(object):
 
         """
 
-        # check if there are results saved with the same id
-        if os.path.isfile(self.filename):
+        # check if there are results saved with the same id, the batch keeps
+        # a listing of the result files while adding many runs
+        listing = self.batch._listing
+        if listing is not None:
+            self._done = self._id in listing
+        elif os.path.isfile(self.filename):
             self._done = True
         else:
             self._done = False
@@ -470,8 +944,12 @@ class ResultRun(Run):
     batch : :py:meth:`~batchpy.batch.Batch` object
         The batch the run belongs to.
 
-    id : str or list of str
-        An id or list of ids specifying previously saved runs.
+    id : str
+        An id specifying a previously saved run.
+
+    metadata : dict, optional
+        Previously loaded metadata of the run. When not supplied, the metadata
+        is loaded from disk when the parameters or runtime are first accessed.
 
     Notes
     -----
@@ -485,7 +963,9 @@ class ResultRun(Run):
 
     """
 
-    def __init__(self, batch, id):
+    __slots__ = ('_parameters', '_metadata_loaded')
+
+    def __init__(self, batch, id, metadata=None):
         """
         Creates a batchpy result run
 
@@ -494,23 +974,95 @@ class ResultRun(Run):
         """
 
         self.batch = batch
+        self._index = None
         self._runtime = None
         self._done = True
+        self._skipped = False
         self._parameters = None
         self._saveresult = True
         self._result = None
+        self._telemetry = None
+        self._checkpoint_time = None
+        self._profile = None
+        self._resultonly = True
+        self._parameter_keys = ()
+        self._parameter_values = ()
+        self._private_parameters = {}
+        self._metadata_loaded = False
 
         self._id = id
 
-        data = self._load()
-        if data is not None:
-            if 'runtime' in data:
-                self._runtime = data['runtime']
+        if metadata is not None:
+            self._set_metadata(metadata)
+
+    @property
+    def parameters(self):
+        """
+        Property returning the run parameters, loaded from disk when first
+        accessed.
+
+        """
+
+        if not self._metadata_loaded:
+            self._set_metadata(self._load_metadata())
+        return self._parameters
+
+    @property
+    def runtime(self):
+        """
+        Property returning the computation time of a run, loaded from disk
+        when first accessed.
 
-            if 'parameters' in data:
-                self._parameters = data['parameters']
+        """
+
+        if not self._metadata_loaded:
+            self._set_metadata(self._load_metadata())
+        return self._runtime
+
+    @property
+    def telemetry(self):
+        """
+        Property returning the telemetry of a run, loaded from disk when first
+        accessed.
+
+        """
 
-            del data
+        if not self._metadata_loaded:
+            self._set_metadata(self._load_metadata())
+        return self._telemetry
+
+    def _set_metadata(self, metadata):
+        """
+        Sets the runtime, parameters and telemetry from a metadata dictionary.
+
+        """
+
+        if metadata is not None:
+            if 'runtime' in metadata:
+                self._runtime = metadata['runtime']
+
+            if 'parameters' in metadata:
+                self._parameters = metadata['parameters']
+
+            if 'telemetry' in metadata:
+                self._telemetry = metadata['telemetry']
+
+        self._metadata_loaded = True
+
+    def load(self):
+        """
+        Loads the run results from disk, caching the metadata when it was not
+        loaded before.
+
+        """
+
+        data = self._load()
+        if data is not None:
+            if not self._metadata_loaded:
+                self._set_metadata(data)
+            return data['res']
+        else:
+            return None
 
     def run(self, **kwargs):
         pass
@@ -526,6 +1078,114 @@ class ResultRun(Run):
         pass
 
 
+def setup_worker(runclasses):
+    """
+    Calls the :py:meth:`~batchpy.run.Run.setup_worker` hook of run classes
+    which were not set up in the current process yet.
+
+    Parameters
+    ----------
+    runclasses : iterable
+        The run classes to set up.
+
+    """
+
+    for runclass in runclasses:
+        if runclass not in _worker_setup:
+            runclass.setup_worker()
+            _worker_setup.add(runclass)
+
+
+def _hash_code(obj, h):
+    """
+    Updates a hash with the code of a function, method, class or module.
+
+    """
+
+    if isinstance(obj, types.CodeType):
+        h.update(obj.co_code)
+        h.update(str(obj.co_names).encode('utf-8'))
+        for const in obj.co_consts:
+            _hash_constant(const, h)
+    elif isinstance(obj, (types.FunctionType, types.MethodType)):
+        _hash_code(obj.__code__, h)
+    elif isinstance(obj, (type, types.ModuleType)):
+        h.update(obj.__name__.encode('utf-8'))
+        module = obj.__module__ if isinstance(obj, type) else obj.__name__
+        for key, val in sorted(vars(obj).items()):
+            if isinstance(val, (staticmethod, classmethod)):
+                val = val.__func__
+            # only functions defined in the module of the class or the module
+            # itself are included
+            if isinstance(val, types.FunctionType) and val.__module__ == module:
+                _hash_code(val, h)
+    else:
+        name = getattr(obj, '__qualname__', getattr(obj, '__name__', obj))
+        h.update(str(name).encode('utf-8'))
+
+
+def _hash_constant(const, h):
+    """
+    Updates a hash with a constant of a code object.
+
+    The elements of sets are hashed in sorted order, as their order depends on
+    the hash seed of the interpreter.
+
+    """
+
+    if isinstance(const, types.CodeType):
+        _hash_code(const, h)
+    elif isinstance(const, tuple):
+        h.update(b'(')
+        for val in const:
+            _hash_constant(val, h)
+            h.update(b',')
+        h.update(b')')
+    elif isinstance(const, (set, frozenset)):
+        digests = []
+        for val in const:
+            element = hashlib.sha1()
+            _hash_constant(val, element)
+            digests.append(element.digest())
+        h.update(b'{')
+        for digest in sorted(digests):
+            h.update(digest)
+        h.update(b'}')
+    else:
+        h.update(repr(const).encode('utf-8'))
+
+
+def _reset_maxrss():
+    """
+    Resets the peak resident set size of the current process, returns
+    :code:`True` when it was reset.
+
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _maxrss():
+    """
+    Returns the peak resident set size of the current process in bytes or
+    :code:`None` when it is not available on the platform.
+
+    """
+
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
 def convert_run_to_newstyle(run):
     """
     Converts a saved run result to include the parameters.
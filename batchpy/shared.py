@@ -0,0 +1,162 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# arrays attached in this process, by their reference
+_attached = {}
+
+
+class SharedArray(np.ndarray):
+    """
+    A read-only numpy array backed by shared memory or a memory mapped file
+
+    When pickled, for instance when it is passed to a worker process as a run
+    parameter, only a reference is stored. Unpickling the reference attaches
+    to the existing memory without copying the data. Views of a shared array
+    are pickled by value.
+
+    Shared arrays should not be created directly but through
+    :py:meth:`~batchpy.batch.Batch.share`.
+
+    """
+
+    def __array_finalize__(self, obj):
+        self._reference = None
+
+    def __reduce__(self):
+        if self._reference is None:
+            return np.asarray(self).__reduce__()
+        return _attach, (self._reference,)
+
+
+def create(array, name, directory=None, backend='auto'):
+    """
+    Copies an array to shared memory or a memory mapped file.
+
+    Parameters
+    ----------
+    array : array_like
+        The data to share.
+
+    name : string
+        A unique name for the shared data.
+
+    directory : string, optional
+        The directory to write memory mapped files to.
+
+    backend : string, optional
+        ``'shm'`` for :code:`multiprocessing.shared_memory`, only available in
+        python 3.8 and later, ``'mmap'`` for a memory mapped ``.npy`` file or
+        ``'auto'`` to use shared memory when available.
+
+    Returns
+    -------
+    array : :py:class:`~batchpy.shared.SharedArray`
+        A read-only view of the shared data.
+
+    """
+
+    array = np.ascontiguousarray(array)
+    if array.dtype.hasobject:
+        raise ValueError('Arrays with python objects can not be shared.')
+
+    if backend == 'auto':
+        backend = 'mmap' if shared_memory is None else 'shm'
+
+    if backend == 'shm':
+        if shared_memory is None:
+            raise ValueError('Shared memory is not available in this python version, use the \'mmap\' backend.')
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        reference = ('shm', shm.name, array.shape, array.dtype.str)
+        _attached[reference] = (_view(shm.buf, reference), shm)
+
+    elif backend == 'mmap':
+        if directory is None:
+            directory = '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        filename = os.path.abspath(os.path.join(directory, '{}.npy'.format(name)))
+        np.save(filename, array)
+        reference = ('mmap', filename, array.shape, array.dtype.str)
+
+    else:
+        raise ValueError('Backend \'{}\' not recognized, should be \'auto\', \'shm\' or \'mmap\'.'.format(backend))
+
+    return _attach(reference)
+
+
+def release(array):
+    """
+    Releases the memory or removes the file backing a shared array.
+
+    Parameters
+    ----------
+    array : :py:class:`~batchpy.shared.SharedArray`
+        The shared array, as returned by
+        :py:meth:`~batchpy.shared.create`.
+
+    """
+
+    reference = array._reference
+    array, handle = _attached.pop(reference, (None, None))
+    if reference[0] == 'shm':
+        if handle is None:
+            handle = shared_memory.SharedMemory(name=reference[1])
+        # the memory is freed when all views are closed
+        handle.unlink()
+        try:
+            handle.close()
+        except BufferError:
+            pass
+    elif os.path.isfile(reference[1]):
+        os.remove(reference[1])
+
+
+def _view(buffer, reference):
+    array = np.ndarray(reference[2], dtype=np.dtype(reference[3]), buffer=buffer).view(SharedArray)
+    array.flags.writeable = False
+    array._reference = reference
+    return array
+
+
+def _attach(reference):
+    """
+    Returns a view of shared data, attaching to it once per process.
+
+    """
+
+    if reference not in _attached:
+        if reference[0] == 'shm':
+            shm = shared_memory.SharedMemory(name=reference[1])
+            _attached[reference] = (_view(shm.buf, reference), shm)
+        else:
+            mmap = np.load(reference[1], mmap_mode='r')
+            _attached[reference] = (_view(mmap, reference), mmap)
+
+    return _attached[reference][0]
@@ -0,0 +1,484 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import io
+import time
+import struct
+import pickle
+
+
+# Result files are regular .npy files holding a pickled dictionary. After the
+# .npy payload a small footer is appended which contains only the run metadata
+# (id, runtime, parameters, ...) followed by its length and a magic string.
+# ``np.load`` stops reading after the payload so the footer is invisible to it,
+# while the metadata can be read by seeking to the end of the file without
+# unpickling the (possibly large) result.
+_FOOTER_MAGIC = b'BATCHPYM'
+_FOOTER_STRUCT = struct.Struct('<Q8s')
+
+
+def save(filename, data, metadata, telemetry=None):
+    """
+    Saves run data to a file with a metadata footer.
+
+    Parameters
+    ----------
+    filename : string
+        The file to save the data to.
+
+    data : dict
+        The complete data dictionary, including the result.
+
+    metadata : dict
+        The metadata which can be read without loading the result.
+
+    telemetry : dict, optional
+        When supplied, the time spent serializing (``serialize``) and writing
+        (``save``) the data and the size of the serialized data in bytes
+        (``size``) are added to the telemetry dictionary, which is stored in
+        the metadata.
+
+    Notes
+    -----
+    The data is written to a temporary file which replaces the file when
+    complete. An existing file is thus never modified in place, which keeps
+    hard links to it intact.
+
+    """
+
+    tempfilename = _tempfilename(filename)
+    try:
+        try:
+            _save(tempfilename, data, metadata, telemetry)
+        except FileNotFoundError:
+            # the folder was removed after it was created, for instance when
+            # the results were cleared between calls
+            dirname = os.path.dirname(filename)
+            if dirname == '' or os.path.isdir(dirname):
+                raise
+            os.makedirs(dirname, exist_ok=True)
+            _save(tempfilename, data, metadata, telemetry)
+        os.replace(tempfilename, filename)
+    except BaseException:
+        if os.path.exists(tempfilename):
+            os.remove(tempfilename)
+        raise
+
+
+def _save(filename, data, metadata, telemetry):
+    import numpy as np
+
+    if telemetry is None:
+        with open(filename, 'wb') as f:
+            np.save(f, data)
+            _write_footer(f, metadata)
+    else:
+        t_start = time.monotonic()
+        buffer = io.BytesIO()
+        np.save(buffer, data)
+        payload = buffer.getvalue()
+        t_serialized = time.monotonic()
+
+        with open(filename, 'wb') as f:
+            f.write(payload)
+            telemetry['serialize'] = t_serialized - t_start
+            telemetry['save'] = time.monotonic() - t_serialized
+            telemetry['size'] = len(payload)
+            _write_footer(f, dict(metadata, telemetry=telemetry))
+
+
+def _write_footer(f, metadata):
+    footer = pickle.dumps(metadata, protocol=2)
+    f.write(footer)
+    f.write(_FOOTER_STRUCT.pack(len(footer), _FOOTER_MAGIC))
+
+
+def _tempfilename(filename):
+    return '{}.{}.tmp'.format(filename, os.getpid())
+
+
+def link(src, dst):
+    """
+    Makes a file available under another name, using a hard link where
+    possible and a copy otherwise.
+
+    Parameters
+    ----------
+    src : string
+        The existing file.
+
+    dst : string
+        The new filename. When it exists already, nothing is done.
+
+    """
+
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        pass
+    except OSError:
+        import shutil
+
+        tempfilename = _tempfilename(dst)
+        shutil.copyfile(src, tempfilename)
+        os.replace(tempfilename, dst)
+
+
+def load(filename):
+    """
+    Loads the complete data dictionary from a file.
+
+    Parameters
+    ----------
+    filename : string
+        The file to load the data from.
+
+    Returns
+    -------
+    data : dict, :code:`None`
+        The data dictionary or :code:`None` when the file does not exist.
+
+    """
+
+    if not os.path.isfile(filename):
+        return None
+
+    import numpy as np
+    return np.load(filename, allow_pickle=True).item()
+
+
+def load_metadata(filename):
+    """
+    Loads only the metadata from a file.
+
+    For files saved without a metadata footer the complete file is loaded and
+    the metadata is extracted from it.
+
+    Parameters
+    ----------
+    filename : string
+        The file to load the metadata from.
+
+    Returns
+    -------
+    metadata : dict, :code:`None`
+        The metadata dictionary or :code:`None` when the file does not exist or
+        does not contain run data.
+
+    """
+
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size > _FOOTER_STRUCT.size:
+                f.seek(-_FOOTER_STRUCT.size, os.SEEK_END)
+                length, magic = _FOOTER_STRUCT.unpack(f.read(_FOOTER_STRUCT.size))
+                if magic == _FOOTER_MAGIC and length <= size - _FOOTER_STRUCT.size:
+                    f.seek(-_FOOTER_STRUCT.size - length, os.SEEK_END)
+                    return pickle.loads(f.read(length))
+    except (IOError, OSError):
+        return None
+
+    # old style file without a footer
+    try:
+        data = load(filename)
+    except Exception:
+        return None
+
+    if not isinstance(data, dict) or 'res' not in data:
+        return None
+
+    return {key: val for key, val in data.items() if not key == 'res'}
+
+
+def result_files(savepath, name):
+    """
+    Returns the result files of a batch in a results folder using a single
+    directory scan.
+
+    Parameters
+    ----------
+    savepath : string
+        The results folder.
+
+    name : string
+        The name of the batch.
+
+    Returns
+    -------
+    files : dict
+        A dictionary of result filenames by run id.
+
+    """
+
+    files = {}
+    if os.path.isdir(savepath):
+        for entry in os.scandir(savepath):
+            parsed = parse_filename(entry.name, name)
+            if parsed is not None and parsed[1] == '.npy' and entry.is_file():
+                files[parsed[0]] = entry.path
+    return files
+
+
+def parse_filename(filename, name):
+    """
+    Splits the name of a file of a run of a batch into the run id and the
+    extension, for instance ``'.npy'``, ``'.ckpt'`` or ``'.npy.{pid}.tmp'``.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file, without folder.
+
+    name : string
+        The name of the batch.
+
+    Returns
+    -------
+    parsed : tuple of strings, :code:`None`
+        The run id and the extension or :code:`None` when the file is not a
+        file of a run of the batch, for instance a file of another batch with
+        a name starting with the batch name.
+
+    """
+
+    prefix = '{}_'.format(name)
+    if not filename.startswith(prefix):
+        return None
+    id = filename[len(prefix):len(prefix) + 40]
+    extension = filename[len(prefix) + 40:]
+    if len(id) < 40 or not set(id) <= _HEXDIGITS or not extension.startswith('.'):
+        return None
+    return id, extension
+
+
+_HEXDIGITS = frozenset('0123456789abcdef')
+
+
+def digests(ids):
+    """
+    Converts hexadecimal run ids to an array of raw 20 byte digests.
+
+    Parameters
+    ----------
+    ids : list of strings
+        The run ids.
+
+    Returns
+    -------
+    digests : numpy array
+        An array with dtype ``S20``.
+
+    """
+
+    import numpy as np
+
+    try:
+        data = bytes.fromhex(''.join(ids))
+    except ValueError:
+        data = b''
+    if len(data) != 20 * len(ids):
+        raise ValueError('Only sha1 hexadecimal ids can be converted to digests.')
+    return np.frombuffer(data, dtype='S20')
+
+
+def hexdigests(digests):
+    """
+    Converts an array of raw 20 byte digests to hexadecimal run ids.
+
+    Parameters
+    ----------
+    digests : numpy array
+        An array with dtype ``S20``.
+
+    Returns
+    -------
+    ids : list of strings
+        The run ids.
+
+    """
+
+    import numpy as np
+
+    # the raw bytes are used as numpy strips trailing null bytes from items
+    data = np.ascontiguousarray(digests, dtype='S20').tobytes().hex()
+    return [data[i:i + 40] for i in range(0, len(data), 40)]
+
+
+def save_ids(filename, ids, format='npy'):
+    """
+    Saves a list of run ids to a file.
+
+    Parameters
+    ----------
+    filename : string
+        The file to save the ids to.
+
+    ids : list of strings
+        The run ids.
+
+    format : string, optional
+        ``'npy'`` for a numpy unicode array, ``'bin'`` for raw 20 byte
+        digests, ``'txt'`` for a text file with an id per line or ``'py'`` for
+        a python file with an ``ids`` list.
+
+    """
+
+    if format == 'npy':
+        import numpy as np
+        np.save(filename, np.array(ids, dtype='U40'))
+
+    elif format == 'bin':
+        with open(filename, 'wb') as f:
+            f.write(digests(ids).tobytes())
+
+    elif format == 'txt':
+        with open(filename, 'w') as f:
+            for i in range(0, len(ids), _CHUNK):
+                f.write(''.join(['{}\n'.format(id) for id in ids[i:i + _CHUNK]]))
+
+    elif format == 'py':
+        with open(filename, 'w') as f:
+            f.write('ids = [\n')
+            for i in range(0, len(ids), _CHUNK):
+                f.write(''.join(['    \'{}\',\n'.format(id) for id in ids[i:i + _CHUNK]]))
+            f.write(']')
+
+    else:
+        raise ValueError('Format \'{}\' not recognized, should be \'npy\', \'bin\', \'txt\' or \'py\'.'
+                         .format(format))
+
+
+# the number of ids written to text files at once
+_CHUNK = 65536
+
+
+def load_ids(filename):
+    """
+    Loads run ids saved with :py:meth:`~batchpy.storage.save_ids`.
+
+    Parameters
+    ----------
+    filename : string
+        The file to load the ids from, the format is determined from the
+        extension.
+
+    Returns
+    -------
+    ids : list of strings, numpy array
+        The run ids, as an array of ``S20`` digests for ``'.bin'`` files.
+
+    """
+
+    format = os.path.splitext(filename)[1][1:]
+    if format == 'npy':
+        import numpy as np
+        return [str(id) for id in np.load(filename)]
+
+    elif format == 'bin':
+        import numpy as np
+        return np.fromfile(filename, dtype='S20')
+
+    elif format == 'txt':
+        with open(filename, 'r') as f:
+            return f.read().split()
+
+    elif format == 'py':
+        import ast
+        with open(filename, 'r') as f:
+            return ast.literal_eval(f.read().split('=', 1)[1].strip())
+
+    else:
+        raise ValueError('Format \'{}\' not recognized, should be \'npy\', \'bin\', \'txt\' or \'py\'.'
+                         .format(format))
+
+
+def remove_many(filenames, threads=None):
+    """
+    Removes files using a thread pool.
+
+    Parameters
+    ----------
+    filenames : list of strings
+        The files to remove, files which do not exist are skipped.
+
+    threads : int, optional
+        The maximum number of threads used, defaults to the
+        :code:`concurrent.futures.ThreadPoolExecutor` default.
+
+    Returns
+    -------
+    report : dict
+        A dictionary with the number of removed files (``files``), their total
+        size in bytes (``size``) and a list of files which could not be
+        removed (``failed``).
+
+    """
+
+    def remove(filename):
+        try:
+            size = os.stat(filename).st_size
+            os.remove(filename)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            return False
+        return size
+
+    if len(filenames) < 2 or threads == 1:
+        sizes = [remove(filename) for filename in filenames]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            sizes = list(executor.map(remove, filenames))
+
+    removed = [size for size in sizes if size is not None and size is not False]
+    return {'files': len(removed), 'size': sum(removed),
+            'failed': [filename for filename, size in zip(filenames, sizes) if size is False]}
+
+
+def load_metadata_many(filenames, threads=None):
+    """
+    Loads the metadata from a list of files using a thread pool.
+
+    Parameters
+    ----------
+    filenames : list of strings
+        The files to load the metadata from.
+
+    threads : int, optional
+        The maximum number of threads used, defaults to the
+        :code:`concurrent.futures.ThreadPoolExecutor` default.
+
+    Returns
+    -------
+    metadata : list
+        A list of metadata dictionaries or :code:`None` in the order of
+        filenames.
+
+    """
+
+    if len(filenames) < 2 or threads == 1:
+        return [load_metadata(filename) for filename in filenames]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(load_metadata, filenames))
@@ -0,0 +1,448 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import time
+import threading
+
+import numpy as np
+
+from .derived import _column
+
+
+class Summary(object):
+    """
+    A table with a row per run of a batch, stored on disk in columns
+
+    The table holds the id, status, runtime and parameters of each run and the
+    scalar results selected when creating the batch. Rows are added as runs
+    finish and appended to the table on disk at most once per interval and at
+    the end of a computation, as a chunk file with only the changed rows. The
+    chunks are merged with the table when they are read and are compacted into
+    ``{name}_summary.npz`` in the results folder when there are many.
+
+    The columns are stored as ``id``, ``status``, ``runtime``,
+    ``parameters.{key}`` and ``results.{key}``. The parameter keys of each row
+    are stored as an index ``parameter_set`` into ``parameter_keys``, so
+    parameters missing for a run are distinguished from ``None`` values.
+
+    A summary should not be created directly but through the ``summary``
+    argument of :py:class:`~batchpy.batch.Batch`.
+
+    """
+
+    # the number of chunks above which they are compacted into the table
+    max_chunks = 64
+
+    def __init__(self, batch, results=(), record=True, interval=10.):
+        self.batch = batch
+        self.results = list(results)
+        self.record = record
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._written = time.monotonic()
+        self._table = (None, None, None)
+
+    def __getstate__(self):
+        return {'batch': self.batch, 'results': self.results, 'record': self.record, 'interval': self.interval}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def filename(self):
+        """
+        Property returning the filename of the summary table.
+
+        """
+
+        return filename(self.batch.savepath, self.batch.name)
+
+    def add(self, run, status='done', res=None):
+        """
+        Adds or updates the row of a run.
+
+        Parameters
+        ----------
+        run : :py:class:`~batchpy.run.Run`
+            The run.
+
+        status : string, optional
+            ``'done'``, ``'failed'`` or ``'skipped'``.
+
+        res : dict, optional
+            The result of the run, from which the selected scalar results are
+            taken.
+
+        """
+
+        results = {}
+        if isinstance(res, dict):
+            for key in self.results:
+                val = res.get(key)
+                if isinstance(val, np.ndarray) and val.ndim == 0:
+                    val = val.item()
+                if np.isscalar(val):
+                    results[key] = val
+
+        parameters = {key: run._serialize(val) for key, val in run.parameters.items()}
+        row = {'status': status, 'runtime': run._runtime, 'parameters': parameters, 'results': results}
+        with self._lock:
+            self._pending[run.id] = row
+
+    def remove(self, ids):
+        """
+        Removes the rows of runs from the table on disk, for instance when
+        their results are cleared.
+
+        Parameters
+        ----------
+        ids : iterable of strings
+            The ids of the runs.
+
+        """
+
+        row = {'status': 'removed', 'runtime': None, 'parameters': {}, 'results': {}}
+        with self._lock:
+            for id in ids:
+                self._pending[id] = row
+        self.write()
+
+    def poll(self):
+        """
+        Writes the changed rows when the interval passed since they were last
+        written.
+
+        """
+
+        if time.monotonic() - self._written >= self.interval:
+            self.write()
+
+    def write(self):
+        """
+        Appends the rows changed since the last write to the table on disk.
+
+        """
+
+        with self._lock:
+            self._written = time.monotonic()
+            pending = self._pending
+            self._pending = {}
+        if len(pending) == 0:
+            return
+
+        savepath = self.batch.savepath
+        if not os.path.isdir(savepath):
+            os.makedirs(savepath, exist_ok=True)
+
+        # chunks are named by time, so they are merged in the order they were
+        # written
+        chunkname = '{}_summary.{:020d}.{}.npz'.format(self.batch.name, int(time.time() * 1e6), os.getpid())
+        _save(os.path.join(savepath, chunkname), columns(pending))
+
+        if len(chunks(savepath, self.batch.name)) > self.max_chunks:
+            compact(savepath, self.batch.name)
+
+    def table(self):
+        """
+        Returns the columns of the table on disk, read again only when the
+        files changed.
+
+        Returns
+        -------
+        columns : dict
+            A dictionary of numpy arrays.
+
+        """
+
+        files = [self.filename] + chunks(self.batch.savepath, self.batch.name)
+        signature = []
+        for name in files:
+            try:
+                stat = os.stat(name)
+            except OSError:
+                continue
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+
+        if self._table[0] != signature:
+            self._table = (signature, merge([_load(name) for name, _, _ in signature]), None)
+        return self._table[1]
+
+    def parameters(self, ids):
+        """
+        Returns the parameters of done runs in the table on disk.
+
+        Parameters
+        ----------
+        ids : iterable of strings
+            The ids of the runs.
+
+        Returns
+        -------
+        parameters : dict
+            A dictionary of parameter dictionaries by run id, for the runs of
+            which the table has a done row.
+
+        """
+
+        table = self.table()
+        signature, _, index = self._table
+        if index is None:
+            index = dict(zip(table['id'].tolist(), range(len(table['id']))))
+            self._table = (signature, table, index)
+        parameter_keys = table['parameter_keys']
+
+        parameters = {}
+        for id in ids:
+            i = index.get(id)
+            if i is None or table['status'][i] != 'done':
+                continue
+            values = {}
+            for key in parameter_keys[table['parameter_set'][i]]:
+                val = table['parameters.{}'.format(key)][i]
+                values[key] = val.item() if isinstance(val, np.generic) else val
+            parameters[id] = values
+        return parameters
+
+
+def filename(savepath, name):
+    """
+    Returns the filename of the summary table of a batch.
+
+    """
+
+    return os.path.join(savepath, '{}_summary.npz'.format(name))
+
+
+def chunks(savepath, name):
+    """
+    Returns the filenames of the chunks of the summary table of a batch in the
+    order they were written.
+
+    """
+
+    prefix = '{}_summary.'.format(name)
+    table = os.path.basename(filename(savepath, name))
+    try:
+        names = [entry.name for entry in os.scandir(savepath)
+                 if entry.name.startswith(prefix) and entry.name.endswith('.npz') and entry.name != table]
+    except OSError:
+        return []
+    return [os.path.join(savepath, name) for name in sorted(names)]
+
+
+def compact(savepath, name):
+    """
+    Merges the chunks of the summary table of a batch into the table.
+
+    Chunks written while compacting are kept. Only one process compacts a
+    table at a time, others skip compacting while a lock file exists.
+
+    """
+
+    lockfilename = os.path.join(savepath, '{}_summary.lock'.format(name))
+    try:
+        # locks left by interrupted processes are removed after a while
+        if time.time() - os.path.getmtime(lockfilename) > _lock_timeout:
+            os.remove(lockfilename)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(lockfilename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except OSError:
+        return
+
+    try:
+        filenames = chunks(savepath, name)
+        table = filename(savepath, name)
+        _save(table, merge([_load(table)] + [_load(chunk) for chunk in filenames]))
+        for chunk in filenames:
+            try:
+                os.remove(chunk)
+            except OSError:
+                pass
+    finally:
+        os.remove(lockfilename)
+
+
+# seconds after which a compaction lock is considered stale
+_lock_timeout = 600.
+
+
+def load(savepath, name):
+    """
+    Reads the summary table of a batch.
+
+    Parameters
+    ----------
+    savepath : string
+        The results folder.
+
+    name : string
+        The name of the batch.
+
+    Returns
+    -------
+    columns : dict
+        A dictionary of numpy arrays.
+
+    """
+
+    return merge([_load(filename(savepath, name))] + [_load(chunk) for chunk in chunks(savepath, name)])
+
+
+def columns(rows):
+    """
+    Converts rows to columns.
+
+    Parameters
+    ----------
+    rows : dict
+        A dictionary of row dictionaries by run id.
+
+    Returns
+    -------
+    columns : dict
+        A dictionary of numpy arrays.
+
+    """
+
+    ids = sorted(rows.keys())
+    table = [rows[id] for id in ids]
+
+    parameter_keys = []
+    parameter_set = []
+    keys = []
+    resultkeys = []
+    for row in table:
+        rowkeys = tuple(row['parameters'].keys())
+        if rowkeys not in parameter_keys:
+            parameter_keys.append(rowkeys)
+            keys += [key for key in rowkeys if key not in keys]
+        parameter_set.append(parameter_keys.index(rowkeys))
+        resultkeys += [key for key in row['results'] if key not in resultkeys]
+
+    data = {
+        'id': np.array(ids, dtype='U40'),
+        'status': np.array([row['status'] for row in table], dtype='U7'),
+        'runtime': np.array([np.nan if row['runtime'] is None else row['runtime'] for row in table], dtype=float),
+        'parameter_set': np.array(parameter_set, dtype=int),
+        'parameter_keys': _column(parameter_keys),
+    }
+    for key in keys:
+        data['parameters.{}'.format(key)] = _column([row['parameters'].get(key) for row in table])
+    for key in resultkeys:
+        data['results.{}'.format(key)] = _column([row['results'].get(key, np.nan) for row in table])
+    return data
+
+
+def merge(tables):
+    """
+    Merges tables, rows of later tables replace rows of earlier tables with the
+    same id. Removed rows are dropped.
+
+    Parameters
+    ----------
+    tables : list of dicts
+        Tables as dictionaries of numpy arrays.
+
+    Returns
+    -------
+    columns : dict
+        A dictionary of numpy arrays sorted by id.
+
+    """
+
+    tables = [table for table in tables if table is not None and len(table['id']) > 0]
+    if len(tables) == 0:
+        return columns({})
+
+    # the parameter sets of all tables are numbered in a common list
+    parameter_keys = []
+    parameter_sets = []
+    for table in tables:
+        mapping = []
+        for keys in table['parameter_keys']:
+            keys = tuple(keys)
+            if keys not in parameter_keys:
+                parameter_keys.append(keys)
+            mapping.append(parameter_keys.index(keys))
+        parameter_sets.append(np.array(mapping, dtype=int)[table['parameter_set']])
+
+    names = []
+    for table in tables:
+        names += [key for key in table if key.startswith(('parameters.', 'results.')) and key not in names]
+
+    data = {
+        'id': np.concatenate([table['id'].astype('U40') for table in tables]),
+        'status': np.concatenate([table['status'].astype('U7') for table in tables]),
+        'runtime': np.concatenate([table['runtime'] for table in tables]),
+        'parameter_set': np.concatenate(parameter_sets),
+    }
+    for key in names:
+        parts = []
+        for table in tables:
+            if key in table:
+                parts.append(table[key])
+            else:
+                part = np.empty(len(table['id']), dtype=object if key.startswith('parameters.') else float)
+                part.fill(None if key.startswith('parameters.') else np.nan)
+                parts.append(part)
+        kinds = set(part.dtype.kind for part in parts)
+        if len(kinds) == 1 or kinds <= set('biuf'):
+            data[key] = np.concatenate(parts)
+        else:
+            data[key] = np.concatenate([part.astype(object) for part in parts])
+
+    # the last row of each id is kept
+    ids, index = np.unique(data['id'][::-1], return_index=True)
+    index = len(data['id']) - 1 - index
+    index = index[data['status'][index] != 'removed']
+    data = {key: val[index] for key, val in data.items()}
+
+    data['parameter_keys'] = _column(parameter_keys)
+    return data
+
+
+def _load(filename):
+    """
+    Reads the columns of a table file or returns :code:`None` when the file
+    does not exist.
+
+    """
+
+    try:
+        with np.load(filename, allow_pickle=True) as data:
+            return {key: data[key] for key in data.files}
+    except (IOError, OSError):
+        return None
+
+
+def _save(filename, columns):
+    """
+    Writes the columns of a table to a file atomically.
+
+    """
+
+    tempfilename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tempfilename, 'wb') as f:
+        np.savez(f, **columns)
+    os.replace(tempfilename, filename)
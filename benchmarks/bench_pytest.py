@@ -0,0 +1,61 @@
+#!/usr/bin/env/ python
+"""
+pytest-benchmark entry point for the asv benchmarks in
+:code:`benchmarks.benchmarks`
+
+Run with ``python -m pytest benchmarks/bench_pytest.py``.
+
+"""
+
+import sys
+import itertools
+import subprocess
+
+import pytest
+
+from . import benchmarks
+
+
+def _cases():
+    cases = []
+    for name in sorted(dir(benchmarks)):
+        cls = getattr(benchmarks, name)
+        if not isinstance(cls, type) or not hasattr(cls, 'params'):
+            continue
+
+        params = cls.params
+        if not isinstance(params, tuple):
+            params = (params,)
+
+        for method in sorted(m for m in dir(cls) if m.startswith('time_')):
+            for args in itertools.product(*params):
+                cases.append(pytest.param(cls, method, args, id='{}.{}{}'.format(name, method, list(args))))
+    return cases
+
+
+@pytest.mark.parametrize('cls,method,args', _cases())
+def test_benchmark(benchmark, cls, method, args):
+    instances = []
+
+    def setup():
+        instance = cls()
+        instance.setup(*args)
+        instances.append(instance)
+        return (instance,), {}
+
+    def target(instance):
+        getattr(instance, method)(*args)
+
+    try:
+        benchmark.pedantic(target, setup=setup, rounds=3)
+    finally:
+        for instance in instances:
+            instance.teardown(*args)
+
+
+@pytest.mark.parametrize('name', benchmarks.Import.params)
+def test_import(benchmark, name):
+    instance = benchmarks.Import()
+    code = instance.timeraw_import(name)
+    benchmark.extra_info['importtime'] = instance.track_importtime(name)
+    benchmark.pedantic(subprocess.check_call, args=([sys.executable, '-c', code],), rounds=3)
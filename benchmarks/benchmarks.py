@@ -0,0 +1,227 @@
+#!/usr/bin/env/ python
+################################################################################
+#    Copyright (C) 2016 Brecht Baeten
+#    This file is part of batchpy.
+#
+#    batchpy is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    batchpy is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with batchpy.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+"""
+Benchmarks of the batchpy overhead
+
+The benchmarks are written as asv benchmark classes and can be run with
+``asv run`` or, using pytest-benchmark, with
+``python -m pytest benchmarks/bench_pytest.py``.
+
+"""
+
+import sys
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+
+import batchpy
+
+
+class NoopRun(batchpy.Run):
+    def run(self, a=0, b=0., c='spam'):
+        return {}
+
+
+class ArrayRun(batchpy.Run):
+    def run(self, size=0):
+        return {'x': np.zeros(size // 8)}
+
+
+def _parameters(n):
+    return [{'a': i, 'b': 0.5 * i, 'c': 'spam'} for i in range(n)]
+
+
+def _importtime(code):
+    """
+    Returns the cumulative import time in microseconds of batchpy and the
+    modules imported after it, as reported by ``python -X importtime``.
+
+    """
+
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True).stderr
+
+    total = 0
+    started = False
+    for line in output.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3:
+            continue
+        name = parts[2].rstrip()
+        # only top level imports, nested imports are included in their parent
+        if name.startswith('  '):
+            continue
+        started = started or name.strip() == 'batchpy'
+        if started:
+            total += int(parts[1])
+    return total
+
+
+class TempBatch(object):
+    """
+    Base class creating a temporary batch path per benchmark
+
+    """
+
+    number = 1
+
+    def setup(self, *args):
+        self.path = tempfile.mkdtemp()
+
+    def teardown(self, *args):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Construction(TempBatch):
+    params = [100, 1000, 10000]
+    param_names = ['n']
+
+    def setup(self, n):
+        super(Construction, self).setup(n)
+        self.parameters = _parameters(n)
+
+    def time_add_run(self, n):
+        batch = batchpy.Batch('bench', path=self.path)
+        for parameters in self.parameters:
+            batch.add_run(NoopRun, parameters)
+
+    def time_add_factorial_runs(self, n):
+        batch = batchpy.Batch('bench', path=self.path)
+        batch.add_factorial_runs(NoopRun, {'a': list(range(n // 10)), 'b': list(range(10))})
+
+    def peakmem_add_factorial_runs(self, n):
+        batch = batchpy.Batch('bench', path=self.path)
+        batch.add_factorial_runs(NoopRun, {'a': list(range(n // 10)), 'b': list(range(10))})
+
+
+class GenerateId(TempBatch):
+    params = [100, 1000, 10000]
+    param_names = ['n']
+
+    def setup(self, n):
+        super(GenerateId, self).setup(n)
+        self.parameters = _parameters(n)
+        self.run = NoopRun(batchpy.Batch('bench', path=self.path))
+
+    def time_generate_id(self, n):
+        for parameters in self.parameters:
+            self.run.generate_id(parameters)
+
+
+class GetRunsWith(TempBatch):
+    params = [100, 1000, 10000]
+    param_names = ['n']
+
+    def setup(self, n):
+        super(GetRunsWith, self).setup(n)
+        self.batch = batchpy.Batch('bench', path=self.path)
+        self.batch.add_factorial_runs(NoopRun, {'a': list(range(n // 10)), 'b': list(range(10))})
+
+    def time_get_runs_with_eq(self, n):
+        self.batch.get_runs_with(a=1)
+
+    def time_get_runs_with_ge(self, n):
+        self.batch.get_runs_with(a__ge=n // 20, b=5)
+
+
+class SaveLoad(TempBatch):
+    params = [1000, 100000, 10000000]
+    param_names = ['size']
+
+    def setup(self, size):
+        super(SaveLoad, self).setup(size)
+        self.batch = batchpy.Batch('bench', path=self.path)
+        self.batch.add_run(ArrayRun, {'size': size})
+        self.run = self.batch.run[0]
+        self.res = self.run.run(size=size)
+        self.run._save(self.res)
+
+    def time_save(self, size):
+        self.run._save(self.res)
+
+    def time_load(self, size):
+        self.run.load()
+
+    def time_load_metadata(self, size):
+        self.run._load_metadata()
+
+
+class SaveIds(TempBatch):
+    params = ([10000, 1000000], ['npy', 'bin', 'txt'])
+    param_names = ['n', 'format']
+
+    def setup(self, n, format):
+        super(SaveIds, self).setup(n, format)
+        self.batch = batchpy.Batch('bench', path=self.path)
+        self.batch.add_resultrun(np.frombuffer(np.random.bytes(20 * n), dtype='S20'))
+
+    def time_save_ids(self, n, format):
+        self.batch.save_ids(format=format)
+
+
+class AddResultrunFolder(TempBatch):
+    params = ([100, 1000, 10000], [True, False])
+    param_names = ['n', 'metadata']
+
+    def setup(self, n, metadata):
+        super(AddResultrunFolder, self).setup(n, metadata)
+        batch = batchpy.Batch('bench', path=self.path)
+        for parameters in _parameters(n):
+            batch.add_run(NoopRun, parameters)
+        batch(verbose=0)
+
+    def time_add_resultrun_folder(self, n, metadata):
+        batch = batchpy.Batch('bench', path=self.path)
+        batch.add_resultrun_folder(metadata=metadata)
+
+
+class Dispatch(TempBatch):
+    params = ([100, 1000], [1, 4])
+    param_names = ['n', 'processes']
+    timeout = 600
+
+    def setup(self, n, processes):
+        super(Dispatch, self).setup(n, processes)
+        self.batch = batchpy.Batch('bench', path=self.path, saveresult=False)
+        for parameters in _parameters(n):
+            self.batch.add_run(NoopRun, parameters)
+
+    def time_call(self, n, processes):
+        self.batch(verbose=0, processes=processes)
+
+
+class Import(object):
+    """
+    Import time of batchpy in a fresh interpreter, the names are imported
+    from their modules when first accessed
+
+    """
+
+    params = ['batchpy', 'batchpy.Run', 'batchpy.Batch']
+    param_names = ['name']
+
+    def timeraw_import(self, name):
+        return 'import batchpy; {}'.format(name)
+
+    def track_importtime(self, name):
+        return _importtime(self.timeraw_import(name))
+
+    track_importtime.unit = 'us'
@@ -5,6 +5,9 @@ import batchpy
 from .test_run import *
 from .test_batch import *
 from .test_various import *
+from .test_progress import *
+from .test_shared import *
+from .test_cli import *
 from .test_doc import *
 
 if __name__ == '__main__':
@@ -2,11 +2,91 @@
 import unittest
 import batchpy
 import time
+import os
+import shutil
+import tempfile
+import pstats
+import pickle
+import threading
+from unittest import mock
 import numpy as np
 
 from .common import MyRun, clear_res
 
 
+class SleepRun(batchpy.Run):
+    def run(self, sleep=0.):
+        time.sleep(sleep)
+        return {'sleep': sleep}
+
+
+class SetupRun(batchpy.Run):
+    @classmethod
+    def setup_worker(cls):
+        cache = cls.worker_cache()
+        cache['setups'] = cache.get('setups', 0) + 1
+
+    def run(self, A=0):
+        return {'pid': os.getpid(), 'setups': self.worker_cache()['setups']}
+
+
+class AllocateRun(batchpy.Run):
+    def run(self, size=0):
+        return {'sum': float(np.ones(size).sum())}
+
+
+class UnpicklableRun(batchpy.Run):
+    def run(self, A=0):
+        if A > 0:
+            return {'lock': threading.Lock()}
+        return {'A': A}
+
+
+class MemoryRun(batchpy.Run):
+    def memory_estimate(self):
+        return self.parameters['memory']
+
+    def run(self, memory=0, sleep=0.):
+        time.sleep(sleep)
+        return {'memory': memory}
+
+
+class ElsewhereRun(batchpy.Run):
+    def run(self, A=0, _marker='here'):
+        if A == 0:
+            # another process computes the run with A=2
+            other = batchpy.Batch(name='testbatch')
+            other.add_run(ElsewhereRun, {'A': 2, '_marker': 'elsewhere'})()
+        return {'marker': _marker}
+
+
+class SlowSave(object):
+    saving = threading.Event()
+
+    def __reduce__(self):
+        # pickling the result happens while it is saved
+        self.saving.set()
+        time.sleep(0.5)
+        return (SlowSave, ())
+
+
+class SlowSaveRun(batchpy.Run):
+    def run(self, A=0):
+        return {'slow': SlowSave()}
+
+
+def total(result):
+    return float(sum(result['a']))
+
+
+derivedbatch = batchpy.Batch(name='derivedbatch')
+
+
+@derivedbatch.derived
+def decorated_length(result):
+    return len(result['a'])
+
+
 class TestBatch(unittest.TestCase):
     def test_create_batch(self):
         name = 'testbatch'
@@ -249,6 +329,44 @@ class TestBatch(unittest.TestCase):
         res = batch.run[1].result
         self.assertEqual(res, {'a': list(range(2000)), 'b': [], 'c': np.mean(list(range(2000)))})
 
+    def test_add_resultrun_lazy(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 1000})
+        batch.add_run(MyRun, {'A': 2000})
+        batch(verbose=0)
+
+        ids = [run.id for run in batch.run]
+
+        # delete and recreate the batch
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun(ids + ['nonexistingid'])
+        self.assertFalse(any(run._metadata_loaded for run in batch.run))
+
+        self.assertEqual(batch.run[1].parameters['A'], 2000)
+        self.assertTrue(batch.run[1]._metadata_loaded)
+        self.assertFalse(batch.run[0]._metadata_loaded)
+        self.assertIsNone(batch.run[2].parameters)
+
+        runs = batch.get_runs_with(A=1000)
+        self.assertTrue(all(run._metadata_loaded for run in batch.run))
+        self.assertEqual(runs, [batch.run[0]])
+
+    def test_add_resultrun_single_id(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 1000})
+        batch(verbose=0)
+
+        id = batch.run[0].id
+
+        # delete and recreate the batch
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun(id)
+
+        self.assertEqual(len(batch.run), 1)
+        self.assertEqual(batch.run[0].parameters['A'], 1000)
+
     def test_add_resultrun_function(self):
         clear_res()
 
@@ -297,6 +415,44 @@ class TestBatch(unittest.TestCase):
         res = batch.run[1].result
         self.assertEqual(res, {'a': list(range(2000)), 'b': [], 'c': np.mean(list(range(2000)))})
 
+    def test_add_resultrun_folder_lazy(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 1000})
+        batch.add_run(MyRun, {'A': 2000})
+        batch(verbose=0)
+
+        # delete and recreate the batch
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun_folder(metadata=False)
+
+        self.assertEqual(len(batch.run), 2)
+        self.assertFalse(any(run._metadata_loaded for run in batch.run))
+
+        runs = batch.get_runs_with(A__ge=1500)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0].result, {'a': list(range(2000)), 'b': [], 'c': np.mean(list(range(2000)))})
+
+    def test_add_resultrun_folder_skips_ids(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 1000})
+        batch.add_run(MyRun, {'A': 2000})
+        batch(verbose=0)
+        batch.save_ids()
+
+        # delete and recreate the batch
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun_folder(threads=2)
+
+        self.assertEqual(len(batch.run), 2)
+        self.assertEqual(sorted(run.parameters['A'] for run in batch.run), [1000, 2000])
+
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun_folder(metadata=False)
+        self.assertEqual(len(batch.run), 2)
+        self.assertEqual(sorted(run.parameters['A'] for run in batch.run), [1000, 2000])
+
     def test_get_runs_with_resultrun(self):
         clear_res()
         batch = batchpy.Batch(name='testbatch')
@@ -314,6 +470,537 @@ class TestBatch(unittest.TestCase):
         self.assertIn(batch.run[1], runs)
         self.assertEqual(len(runs), 1)
 
+    def test_telemetry(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', telemetry=True)
+        batch.add_run(MyRun, {'A': 1000})
+        batch.add_run(MyRun, {'A': 2000})
+        batch(verbose=0)
+
+        table = batch.telemetry()
+        self.assertEqual(list(table['index']), [0, 1])
+        self.assertEqual(list(table['id']), [run.id for run in batch.run])
+        self.assertTrue(all(table['wall'] >= 0))
+        self.assertTrue(all(table['cpu'] >= 0))
+        self.assertTrue(all(table['size'] > 0))
+        self.assertTrue(all(table['save'] >= 0))
+        self.assertEqual(list(table['worker']), ['MainProcess', 'MainProcess'])
+        self.assertEqual(table['task'][1], table['task'][0] + 1)
+
+    def test_telemetry_maxrss(self):
+        batch = batchpy.Batch(name='testbatch', telemetry=True, saveresult=False)
+        batch.add_run(AllocateRun, {'size': 12500000})
+        batch.add_run(AllocateRun, {'size': 0})
+        batch(verbose=0)
+
+        table = batch.telemetry()
+        if not table['maxrss_reset'].all():
+            self.skipTest('the peak resident set size can not be reset on this platform')
+        # the peak of the first run is not included in the peak of the second
+        self.assertGreater(table['maxrss'][0] - table['maxrss'][1], 50e6)
+        self.assertEqual(batch.run[1].telemetry['task'], batch.run[0].telemetry['task'] + 1)
+
+    def test_telemetry_async(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', telemetry=True)
+        batch.add_run(MyRun, {'A': 1000})
+        batch.add_run(MyRun, {'A': 2000})
+        batch(verbose=0, processes=2)
+
+        table = batch.telemetry()
+        self.assertEqual(len(table), 2)
+        self.assertTrue(all(table['size'] > 0))
+        self.assertNotIn('MainProcess', list(table['worker']))
+
+        ids = [run.id for run in batch.run]
+
+        # delete and recreate the batch
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun(ids)
+        self.assertEqual(list(batch.telemetry()['size']), list(table['size']))
+
+    def test_telemetry_disabled(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 1000})
+        batch(verbose=0)
+
+        self.assertIsNone(batch.run[0].telemetry)
+        self.assertEqual(len(batch.telemetry()), 0)
+
+    def test_profile(self):
+        clear_res()
+        profile_dir = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='testbatch', saveresult=False)
+            batch.add_run(MyRun, {'A': 10})
+            batch.add_run(MyRun, {'A': 20})
+            batch.add_run(MyRun, {'A': 30})
+            batch(verbose=0, profile='both', profile_dir=profile_dir)
+
+            for run in batch.run:
+                self.assertFalse(os.path.isfile(os.path.join(profile_dir, 'testbatch_{}.prof'.format(run.id))))
+                self.assertIsNone(run._profile)
+
+            stats = pstats.Stats(os.path.join(profile_dir, 'testbatch_runs.prof'))
+            calls = {key[2]: val[1] for key, val in stats.stats.items()}
+            self.assertEqual(calls['run'], 3)
+            self.assertNotIn('_finish_run', calls)
+
+            # the dispatch profile covers the whole loop, the runs are paused
+            stats = pstats.Stats(os.path.join(profile_dir, 'testbatch_dispatch.prof'))
+            calls = {key[2]: val[1] for key, val in stats.stats.items()}
+            self.assertEqual(calls['_finish_run'], 3)
+            self.assertNotIn('run', calls)
+        finally:
+            shutil.rmtree(profile_dir)
+
+    def test_profile_async(self):
+        clear_res()
+        profile_dir = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='testbatch', saveresult=False)
+            batch.add_run(MyRun, {'A': 10})
+            batch.add_run(MyRun, {'A': 20})
+            batch(verbose=0, processes=2, profile='runs', profile_dir=profile_dir)
+
+            self.assertTrue(os.path.isfile(os.path.join(profile_dir, 'testbatch_runs.prof')))
+            self.assertFalse(os.path.isfile(os.path.join(profile_dir, 'testbatch_dispatch.prof')))
+        finally:
+            shutil.rmtree(profile_dir)
+
+    def test_profile_invalid(self):
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        self.assertRaises(ValueError, batch, verbose=0, profile='all')
+
+    def test_cache(self):
+        clear_res()
+        cache = tempfile.mkdtemp()
+        try:
+            batch1 = batchpy.Batch(name='testbatch', cache=cache)
+            batch1.add_run(MyRun, {'A': 1000})
+            batch1(verbose=0)
+            self.assertEqual(len(os.listdir(cache)), 1)
+
+            batch2 = batchpy.Batch(name='otherbatch', cache=cache)
+            batch2.add_run(MyRun, {'A': 1000})
+            batch2.add_run(MyRun, {'A': 2000})
+            self.assertFalse(batch2.run[0].done)
+            batch2(verbose=0, processes=2)
+
+            self.assertTrue(os.path.samefile(batch1.run[0].filename, batch2.run[0].filename))
+            self.assertEqual(batch2.run[0].runtime, batch1.run[0].runtime)
+            self.assertEqual(batch2.run[0].result, batch1.run[0].result)
+            self.assertEqual(len(os.listdir(cache)), 2)
+
+            batch3 = batchpy.Batch(name='testbatch', saveresult=False, cache=cache)
+            batch3.add_run(MyRun, {'A': 2000})
+            res = batch3.run[0]()
+            self.assertEqual(res, batch2.run[1].result)
+        finally:
+            shutil.rmtree(cache)
+
+    def test_cache_version(self):
+        clear_res()
+
+        class MyVersionedRun(MyRun):
+            version = 2
+
+        batch = batchpy.Batch(name='testbatch')
+        run1 = MyRun(batch, A=1000)
+        run2 = MyVersionedRun(batch, A=1000)
+        self.assertEqual(run1.id, run2.id)
+        self.assertNotEqual(run1.cache_key(), run2.cache_key())
+
+    def test_cache_collision(self):
+        clear_res()
+        cache = tempfile.mkdtemp()
+        try:
+            # run classes with the same name in different modules
+            Run1 = type('Simulation', (batchpy.Run,), {'__module__': 'study1', 'run': lambda self, A=1: {'A': A}})
+            Run2 = type('Simulation', (batchpy.Run,), {'__module__': 'study2', 'run': lambda self, A=1: {'A': -A}})
+
+            batch1 = batchpy.Batch(name='testbatch', cache=cache)
+            run1 = batch1.add_run(Run1, {'A': 2})
+            batch2 = batchpy.Batch(name='otherbatch', cache=cache)
+            run2 = batch2.add_run(Run2, {'A': 2})
+            self.assertEqual(run1.id, run2.id)
+            self.assertNotEqual(run1.cache_key(), run2.cache_key())
+
+            batch1(verbose=0)
+            batch2(verbose=0)
+            self.assertEqual(run1.result, {'A': 2})
+            self.assertEqual(run2.result, {'A': -2})
+        finally:
+            shutil.rmtree(cache)
+
+    def test_sampler(self):
+        clear_res()
+
+        def sampler(run, res):
+            if run.parameters['A'] > 1:
+                return [{'A': run.parameters['A'] // 2}, (MyRun, {'A': 16})]
+
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 16})
+        batch(verbose=0, sampler=sampler)
+
+        self.assertEqual([run.parameters['A'] for run in batch.run], [16, 8, 4, 2, 1])
+        self.assertTrue(all(run.done for run in batch.run))
+        self.assertEqual([run.index for run in batch.run], [0, 1, 2, 3, 4])
+        self.assertEqual(batch.run[4].result['a'], [0])
+
+        # resume from the saved results
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 16})
+        batch(verbose=0, sampler=sampler)
+        self.assertEqual([run.parameters['A'] for run in batch.run], [16, 8, 4, 2, 1])
+
+    def test_sampler_async(self):
+        clear_res()
+        states = []
+
+        def sampler(run, res):
+            if run.parameters['A'] > 1:
+                return [{'A': run.parameters['A'] // 2}]
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_run(MyRun, {'A': 16})
+        batch.add_run(MyRun, {'A': 12})
+        batch(verbose=0, processes=2, sampler=sampler, progress=states.append)
+
+        self.assertEqual(sorted(run.parameters['A'] for run in batch.run), [1, 2, 3, 4, 6, 8, 12, 16])
+        self.assertTrue(all(run.done for run in batch.run))
+        self.assertEqual(states[-1].done, 8)
+        self.assertEqual(states[-1].total, 8)
+
+    def test_prune(self):
+        clear_res()
+
+        def prune(run, finished, res):
+            return finished.parameters['A'] >= 3 and run.parameters['A'] > finished.parameters['A']
+
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4, 5, 6]})
+        states = []
+        batch(verbose=0, prune=prune, progress=states.append)
+
+        self.assertEqual([run.done for run in batch.run], [True, True, True, False, False, False])
+        self.assertEqual([run.skipped for run in batch.run], [False, False, False, True, True, True])
+        self.assertEqual(states[-1].skipped, 3)
+        self.assertEqual(states[-1].done, 6)
+
+        # skipped runs are computed in a next call
+        batch(verbose=0)
+        self.assertTrue(all(run.done for run in batch.run))
+        self.assertFalse(any(run.skipped for run in batch.run))
+
+    def test_prune_lazy(self):
+        clear_res()
+        calls = []
+
+        def prune(run, finished, res):
+            calls.append((run.parameters['A'], finished.parameters['A']))
+            return finished.parameters['A'] == 2 and run.parameters['A'] == 4
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4, 5]})
+        batch(verbose=0, prune=prune)
+
+        # queued runs are checked once against each run finished before them
+        self.assertEqual(calls, [(2, 1), (3, 1), (3, 2), (4, 1), (4, 2), (5, 1), (5, 2), (5, 3)])
+        self.assertEqual([run.skipped for run in batch.run], [False, False, False, True, False])
+
+    def test_prune_async(self):
+        clear_res()
+
+        def prune(run, finished, res):
+            return run.parameters['A'] >= 3
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4, 5, 6]})
+        batch(verbose=0, processes=2, prune=prune)
+
+        self.assertEqual([run.done for run in batch.run], [True, True, False, False, False, False])
+        self.assertEqual([run.skipped for run in batch.run], [False, False, True, True, True, True])
+
+    def test_prune_running(self):
+        clear_res()
+
+        def prune(run, finished, res):
+            return run.parameters['sleep'] > 0.2
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_run(SleepRun, {'sleep': 0.})
+        batch.add_run(SleepRun, {'sleep': 0.5})
+        batch(verbose=0, processes=2, prune=prune, prune_running=True)
+
+        self.assertEqual([run.done for run in batch.run], [True, False])
+        self.assertEqual([run.skipped for run in batch.run], [False, True])
+        self.assertIsNone(batch.run[1].result)
+
+    def test_setup_worker(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(SetupRun, {'A': [1, 2, 3, 4]})
+        batch(verbose=0)
+        self.assertEqual([run.result['setups'] for run in batch.run], [1, 1, 1, 1])
+
+    def test_setup_worker_warmup(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(SetupRun, {'A': [1, 2, 3, 4, 5, 6]})
+        batch(verbose=0, processes=2, warmup=True)
+        self.assertEqual([run.result['setups'] for run in batch.run], [1, 1, 1, 1, 1, 1])
+        self.assertLessEqual(len(set(run.result['pid'] for run in batch.run)), 2)
+
+    def test_max_inflight(self):
+        clear_res()
+        inflight = []
+        prepare = batchpy.batch._Dispatcher._prepare
+
+        def _prepare(dispatcher, ind):
+            inflight.append(len(dispatcher.inflight))
+            return prepare(dispatcher, ind)
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MyRun, {'A': list(range(20))})
+        with mock.patch.object(batchpy.batch._Dispatcher, '_prepare', _prepare):
+            batch(verbose=0, processes=2, max_inflight=3)
+
+        self.assertTrue(all(run.done for run in batch.run))
+        self.assertEqual(len(inflight), 20)
+        self.assertLessEqual(max(inflight), 2)
+
+    def test_max_inflight_invalid(self):
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_run(MyRun, {'A': 1})
+        self.assertRaises(ValueError, batch, verbose=0, processes=2, max_inflight=0)
+
+    def test_unpicklable_result(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(UnpicklableRun, {'A': [0, 1, 2]})
+        progress = []
+        batch(processes=2, verbose=0, progress=progress.append)
+
+        self.assertEqual([run.done for run in batch.run], [True, False, False])
+        self.assertEqual(progress[-1].failed, 2)
+
+    def test_memory(self):
+        clear_res()
+        reserved = []
+        prepare = batchpy.batch._Dispatcher._prepare
+
+        def _prepare(dispatcher, ind):
+            reserved.append((sum(dispatcher.reserved.values()), len(dispatcher.inflight)))
+            return prepare(dispatcher, ind)
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MemoryRun, {'memory': [8, 1, 8, 1, 1, 12], 'sleep': [0.05]})
+        with mock.patch.object(batchpy.batch._Dispatcher, '_prepare', _prepare):
+            batch(verbose=0, processes=3, memory=10)
+
+        self.assertTrue(all(run.done for run in batch.run))
+        for memory, inflight in reserved:
+            self.assertTrue(memory <= 10 or inflight == 0)
+
+    def test_memory_serial(self):
+        clear_res()
+        sizes = []
+        prepare = batchpy.batch._Dispatcher._prepare
+
+        def _prepare(dispatcher, ind):
+            sizes.append((len(dispatcher.reserved), len(dispatcher.checked)))
+            return prepare(dispatcher, ind)
+
+        def prune(run, finished, res):
+            return False
+
+        with mock.patch.object(batchpy.batch._Dispatcher, '_prepare', _prepare):
+            for memory in [10, None]:
+                batch = batchpy.Batch(name='testbatch', saveresult=False)
+                batch.add_factorial_runs(MemoryRun, {'memory': [1, 2, 3, 4, 5]})
+                batch(verbose=0, memory=memory, prune=prune)
+
+        # only the run being computed is reserved and checked runs are
+        # forgotten once submitted
+        self.assertEqual(sizes, [(1, 0)] * 5 + [(0, 0)] * 5)
+
+    def test_memory_estimator(self):
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        small = batch.add_run(SleepRun, {'sleep': 0.})
+        large = batch.add_run(SleepRun, {'sleep': 1.})
+        new = batch.add_run(SleepRun, {'sleep': 1.})
+        small._telemetry = {'maxrss': 100, 'maxrss_reset': True, 'task': 3}
+        large._telemetry = {'maxrss': 1000, 'maxrss_reset': False, 'task': 0}
+
+        estimator = batchpy.batch._MemoryEstimator(default=500)
+        self.assertEqual(estimator(new), 500)
+        estimator.add(small)
+        estimator.add(large)
+        self.assertEqual(estimator(new), 1000)
+        self.assertEqual(estimator(batch.add_run(SleepRun, {'sleep': 0.})), 100)
+        self.assertEqual(estimator(batch.add_run(MemoryRun, {'memory': 20})), 20)
+
+        # peaks of workers which computed other runs before are not used
+        lifetime = batch.add_run(SleepRun, {'sleep': 2.})
+        lifetime._telemetry = {'maxrss': 10000, 'maxrss_reset': False, 'task': 1}
+        estimator.add(lifetime)
+        self.assertEqual(estimator(batch.add_run(SleepRun, {'sleep': 2.})), 1000)
+
+    def test_snapshot(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3]})
+        self.assertIsNone(batch.progress())
+        batch(runs=[0, 2], verbose=0)
+
+        table = batch.snapshot()
+        self.assertEqual(list(table['index']), [0, 1, 2])
+        self.assertEqual(list(table['id']), [run.id for run in batch.run])
+        self.assertEqual(list(table['done']), [True, False, True])
+        self.assertTrue(np.isnan(table['runtime'][1]))
+        self.assertEqual(batch.progress().done, 2)
+
+    def test_concurrent_queries(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(SleepRun, {'sleep': [0.01 * i for i in range(1, 11)]})
+
+        thread = threading.Thread(target=batch, kwargs={'verbose': 0, 'processes': 2})
+        thread.start()
+        done = []
+        while thread.is_alive():
+            table = batch.snapshot()
+            for index in np.where(table['done'])[0]:
+                # results of runs marked as done are saved completely
+                self.assertIsNotNone(batch.run[index].result)
+            done.append(table['done'].sum())
+            batch.get_runs_with(sleep__ge=0.05)
+            batch.progress()
+            time.sleep(0.005)
+        thread.join()
+
+        self.assertEqual(done, sorted(done))
+        self.assertTrue(batch.snapshot()['done'].all())
+        self.assertEqual(batch.progress().done, 10)
+
+    def test_query_while_saving(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(SlowSaveRun, {'A': 1})
+
+        SlowSave.saving.clear()
+        thread = threading.Thread(target=batch, kwargs={'verbose': 0})
+        thread.start()
+        self.assertTrue(SlowSave.saving.wait(5.))
+
+        # the state is not locked while the result is saved
+        start = time.monotonic()
+        self.assertFalse(batch.snapshot()['done'][0])
+        self.assertLess(time.monotonic() - start, 0.25)
+        thread.join()
+        self.assertTrue(batch.snapshot()['done'][0])
+
+    def test_pickle(self):
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_run(MyRun, {'A': 1})
+        copy = pickle.loads(pickle.dumps(batch))
+        self.assertEqual(copy.run, [])
+        with copy._lock:
+            self.assertEqual(copy.name, 'testbatch')
+
+    def test_shard(self):
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': list(range(20))})
+
+        for strategy in ['hash', 'round_robin', 'cost_balanced']:
+            shards = [batch.shard(k, 3, strategy=strategy) for k in range(3)]
+            self.assertEqual(sorted(sum(shards, [])), list(range(20)))
+            self.assertEqual(shards[1], batch.shard(1, 3, strategy=strategy))
+
+        self.assertEqual([len(batch.shard(k, 3, strategy='round_robin')) for k in range(3)], [7, 7, 6])
+        self.assertRaises(ValueError, batch.shard, 3, 3)
+        self.assertRaises(ValueError, batch.shard, 0, 3, strategy='random')
+
+    def test_shard_hash_stable(self):
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': list(range(20))})
+        ids = [batch.run[index].id for index in batch.shard(1, 3)]
+
+        # adding runs does not move runs to other shards
+        batch.add_factorial_runs(MyRun, {'A': list(range(20, 40))})
+        self.assertEqual(ids, [batch.run[index].id for index in batch.shard(1, 3)][:len(ids)])
+
+        # runs outside the shard are not created
+        sharded = batchpy.Batch(name='testbatch')
+        sharded.add_factorial_runs(MyRun, {'A': list(range(40))}, shard=(1, 3))
+        self.assertEqual([run.id for run in sharded.run], [batch.run[index].id for index in batch.shard(1, 3)])
+
+    def test_shard_cost_balanced(self):
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4, 5, 6]})
+
+        def cost(run):
+            return {1: 10., 2: 1., 3: 1., 4: 1., 5: 5., 6: 3.}[run.parameters['A']]
+
+        loads = [sum(cost(batch.run[index]) for index in batch.shard(k, 2, strategy='cost_balanced', cost=cost))
+                 for k in range(2)]
+        self.assertEqual(sorted(loads), [10., 11.])
+
+    def test_shard_cost_balanced_frozen(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(SleepRun, {'sleep': [0., 0.01, 0.02, 0.03, 0.04, 0.05]})
+        batch(runs=[0, 3], verbose=0)
+        shards = [batch.shard(k, 2, strategy='cost_balanced') for k in range(2)]
+        self.assertEqual(sorted(shards[0] + shards[1]), list(range(6)))
+
+        # shards computed later use the same costs
+        batch(runs=[1, 2, 4, 5], verbose=0)
+        other = batchpy.Batch(name='testbatch')
+        other.add_factorial_runs(SleepRun, {'sleep': [0., 0.01, 0.02, 0.03, 0.04, 0.05]})
+        self.assertEqual([other.shard(k, 2, strategy='cost_balanced') for k in range(2)], shards)
+
+    def test_refresh(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3]})
+
+        other = batchpy.Batch(name='testbatch')
+        other.add_factorial_runs(MyRun, {'A': [1, 2, 3]})
+        other(runs=[0, 2], verbose=0)
+
+        self.assertEqual(list(batch.refresh()), [True, False, True])
+        self.assertTrue(batch.run[2].done)
+
+        other.run[2].clear()
+        self.assertEqual(list(batch.refresh([1, 2])), [False, False])
+        self.assertFalse(batch.run[2].done)
+
+    def test_refresh_listing(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': list(range(1, 151))})
+        batch(runs=[0, 149], verbose=0)
+
+        other = batchpy.Batch(name='testbatch')
+        other.add_factorial_runs(MyRun, {'A': list(range(1, 151))})
+        self.assertEqual([i for i, run in enumerate(other.run) if run.done], [0, 149])
+        self.assertIsNone(other._listing)
+
+    def test_refresh_dispatch(self):
+        for processes in [1, 2]:
+            clear_res()
+            batch = batchpy.Batch(name='testbatch')
+            batch.add_factorial_runs(ElsewhereRun, {'A': [0, 1, 2]})
+            states = []
+            batch(verbose=0, processes=processes, refresh=0., max_inflight=1, progress=states.append)
+
+            self.assertEqual([run.result['marker'] for run in batch.run], ['here', 'here', 'elsewhere'])
+            self.assertEqual(states[-1].done, 3)
+
     def test_save_ids(self):
         clear_res()
         batch = batchpy.Batch(name='testbatch')
@@ -339,6 +1026,255 @@ class TestBatch(unittest.TestCase):
         from _res.testbatch_ids import ids
         self.assertEqual(ids, old_ids)
 
+    def test_save_ids_formats(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3]})
+        old_ids = [run.id for run in batch.run]
+
+        for format in ['npy', 'bin', 'txt', 'py']:
+            batch.save_ids(format=format)
+            ids = batchpy.storage.load_ids(os.path.join('_res', 'testbatch_ids.{}'.format(format)))
+            if format == 'bin':
+                self.assertEqual(ids.dtype, np.dtype('S20'))
+                self.assertEqual(os.path.getsize('_res/testbatch_ids.bin'), 60)
+                ids = batchpy.storage.hexdigests(ids)
+            self.assertEqual(ids, old_ids)
+
+        self.assertRaises(ValueError, batch.save_ids, format='csv')
+
+    def test_add_resultrun_digests(self):
+        # numpy strips trailing null bytes of S20 items
+        ids = ['3ecc784a9d5cf26eb6420de2a43f04b310073925', '3ecc784a9d5cf26eb6420de2a43f04b310073900']
+        digests = batchpy.storage.digests(ids)
+        self.assertEqual(batchpy.storage.hexdigests(digests), ids)
+
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_resultrun(digests)
+        self.assertEqual([run.id for run in batch.run], ids)
+        self.assertRaises(ValueError, batchpy.storage.digests, ['spam'])
+
+    def test_clear(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4]})
+        batch(verbose=0)
+        size = os.path.getsize(batch.run[0].filename)
+
+        report = batch.clear(runs=[0, 1, 2], where={'A__ge': 2})
+        self.assertEqual(report['runs'], 2)
+        self.assertEqual(report['files'], 2)
+        self.assertEqual(report['failed'], [])
+        self.assertGreater(report['size'], size)
+        self.assertEqual([run.done for run in batch.run], [True, False, False, True])
+        self.assertEqual(list(batch.refresh()), [True, False, False, True])
+
+        report = batch.clear(where=lambda run: run.parameters['A'] == 4)
+        self.assertEqual(report['runs'], 1)
+        self.assertFalse(batch.run[3].done)
+
+        report = batch.clear(threads=2)
+        self.assertEqual(report['files'], 1)
+        self.assertFalse(any(run.done for run in batch.run))
+
+    def test_retain(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4]})
+        batch(verbose=0)
+        now = time.time()
+        for i, run in enumerate(batch.run):
+            os.utime(run.filename, (now - 100 * i, now - 100 * i))
+
+        report = batch.retain(keep=3)
+        self.assertEqual(report['runs'], 1)
+        self.assertEqual([run.done for run in batch.run], [True, True, True, False])
+
+        report = batch.retain(max_age=150)
+        self.assertEqual([run.done for run in batch.run], [True, True, False, False])
+
+        size = os.path.getsize(batch.run[0].filename)
+        report = batch.retain(max_size=size + 1)
+        self.assertEqual(report['files'], 1)
+        self.assertEqual([run.done for run in batch.run], [True, False, False, False])
+
+    def test_clear_res_path(self):
+        path = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='testbatch', path=path)
+            batch.add_run(MyRun, {'A': 1})
+            batch(verbose=0)
+            report = batchpy.clear_res(path)
+            self.assertEqual(report['files'], 2)
+            self.assertEqual(os.listdir(os.path.join(path, '_res')), [])
+        finally:
+            shutil.rmtree(path)
+
+    def test_savepath_removed(self):
+        path = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='testbatch', path=path)
+            batch.add_factorial_runs(MyRun, {'A': [1, 2]})
+            batch(runs=[0], verbose=0)
+            shutil.rmtree(os.path.join(path, '_res'))
+            batch(runs=[1], verbose=0)
+            self.assertTrue(os.path.isfile(batch.run[1].filename))
+        finally:
+            shutil.rmtree(path)
+
+    def test_derived(self):
+        path = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='testbatch', path=path)
+            batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4]})
+            batch(runs=[0, 1, 2], verbose=0)
+
+            derived = batch.derived(total)
+            self.assertEqual(derived.name, 'total')
+
+            @batch.derived(name='length')
+            def length(result):
+                return len(result['a'])
+
+            values = derived(processes=2)
+            self.assertEqual(list(values[:3]), [0., 1., 3.])
+            self.assertTrue(np.isnan(values[3]))
+            self.assertTrue(os.path.isfile(derived.filename))
+
+            # memoized values are not computed again
+            with mock.patch.object(batchpy.storage, 'load', side_effect=AssertionError):
+                self.assertEqual(list(derived(runs=[1, 2])), [1., 3.])
+
+            batch(verbose=0)
+            table = batch.derived_table()
+            self.assertEqual(list(table['total']), [0., 1., 3., 6.])
+            self.assertEqual(list(table['length']), [1, 2, 3, 4])
+            self.assertEqual(list(table['id']), [run.id for run in batch.run])
+
+            # memoized values of cleared results are removed
+            batch.clear(runs=[3])
+            self.assertNotIn(batch.run[3].id, derived.load())
+            self.assertIn(batch.run[2].id, derived.load())
+            self.assertTrue(np.isnan(derived()[3]))
+        finally:
+            shutil.rmtree(path)
+
+    def test_derived_batch_names(self):
+        path = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='a', path=path)
+            other = batchpy.Batch(name='a_b', path=path)
+            for b in (batch, other):
+                b.add_factorial_runs(MyRun, {'A': [1, 2]})
+                b(verbose=0)
+
+            def b_total(result):
+                return float(sum(result['a']))
+            first = batch.derived(b_total)
+            second = other.derived(total)
+            self.assertNotEqual(first.filename, second.filename)
+            self.assertEqual(list(first()), [0., 1.])
+            self.assertEqual(list(second()), [0., 1.])
+
+            # clearing batch a keeps the memoized values of batch a_b
+            batch.clear()
+            self.assertEqual(first.load(), {})
+            self.assertEqual(len(second.load()), 2)
+        finally:
+            shutil.rmtree(path)
+
+    def test_derived_decorator_processes(self):
+        path = tempfile.mkdtemp()
+        try:
+            derivedbatch.path = path
+            derivedbatch.add_factorial_runs(MyRun, {'A': [1, 2, 3]})
+            derivedbatch(verbose=0)
+            self.assertIsInstance(decorated_length, batchpy.derived.Derived)
+            self.assertEqual(list(decorated_length(processes=2)), [1, 2, 3])
+        finally:
+            shutil.rmtree(path)
+
+    def test_derived_code_hash(self):
+        path = tempfile.mkdtemp()
+        try:
+            batch = batchpy.Batch(name='testbatch', path=path, saveresult=False)
+            batch.add_factorial_runs(MyRun, {'A': [1, 2]})
+            batch(verbose=0)
+
+            def kpi(result):
+                return len(result['a'])
+            first = batch.derived(kpi)
+
+            def kpi(result):
+                return 2 * len(result['a'])
+            second = batch.derived(kpi)
+
+            self.assertNotEqual(first.filename, second.filename)
+            self.assertEqual(list(first()), [1, 2])
+            self.assertEqual(list(second()), [2, 4])
+        finally:
+            shutil.rmtree(path)
+
+    def test_summary(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', summary=['c'])
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3], 'B': [None, 5]})
+        batch(runs=[0, 1, 2], verbose=0)
+        batch(processes=2, verbose=0)
+
+        table = batch.summary()
+        self.assertEqual(sorted(table['id']), sorted(run.id for run in batch.run))
+        self.assertEqual(list(table['status']), ['done'] * 6)
+        self.assertTrue(np.all(table['runtime'] >= 0))
+        order = np.argsort(table['parameters.A'] + 10 * (table['parameters.B'] == 5))
+        self.assertEqual(list(table['results.c'][order]), [0., 0.5, 1., 0., 0.5, 1.])
+        self.assertEqual(list(table['parameters.B'][order]), [None, None, None, 5, 5, 5])
+
+        # the table is read from disk by other batches
+        self.assertEqual(len(batchpy.summary.chunks(batch.savepath, 'testbatch')), 2)
+        self.assertEqual(sorted(batchpy.Batch(name='testbatch').summary()['id']), sorted(table['id']))
+        loaded = batchpy.summary.load(batch.savepath, 'testbatch')
+        self.assertEqual(list(loaded['id']), list(table['id']))
+
+        # the parameters of result runs are taken from the table
+        resultbatch = batchpy.Batch(name='testbatch')
+        resultbatch.add_resultrun_folder(metadata=False)
+        with mock.patch.object(batchpy.storage, 'load_metadata_many', side_effect=AssertionError):
+            runs = resultbatch.get_runs_with(A__ge=2, B=5)
+        self.assertEqual(sorted(run.id for run in runs), sorted(run.id for run in batch.get_runs_with(A__ge=2, B=5)))
+        self.assertEqual(len(runs), 2)
+
+        # rows removed by other batches are not written again
+        other = batchpy.Batch(name='testbatch', summary=True)
+        other.add_factorial_runs(MyRun, {'A': [1, 2, 3], 'B': [None, 5]})
+        other.clear(runs=[0])
+        batch.add_run(MyRun, {'A': 4})
+        batch(runs=[6], verbose=0)
+        table = batch.summary()
+        self.assertNotIn(batch.run[0].id, table['id'])
+        self.assertIn(batch.run[6].id, table['id'])
+        self.assertEqual(len(table['id']), 6)
+
+        batch.retain(keep=3)
+        self.assertEqual(len(batch.summary()['id']), 3)
+
+    def test_summary_compact(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', summary=True)
+        batch._summary.max_chunks = 2
+        batch.add_factorial_runs(MyRun, {'A': [1, 2, 3, 4]})
+        for ind in range(4):
+            batch(runs=[ind], verbose=0)
+
+        self.assertLessEqual(len(batchpy.summary.chunks(batch.savepath, 'testbatch')), 2)
+        self.assertTrue(os.path.isfile(batch._summary.filename))
+        self.assertEqual(sorted(batch.summary()['parameters.A']), [1, 2, 3, 4])
+
+        # the table is not read again when the files did not change
+        with mock.patch.object(batchpy.summary, '_load', side_effect=AssertionError):
+            self.assertEqual(len(batch.get_runs_with(A__ge=2)), 3)
+            batch.summary()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+import unittest
+import os
+import io
+import csv
+import shutil
+import tempfile
+import contextlib
+
+from batchpy import cli
+
+
+BATCHFILE = """
+import batchpy
+
+
+class CliRun(batchpy.Run):
+    def run(self, A=0):
+        return {{'A2': A**2}}
+
+
+batch = batchpy.Batch('clibatch', path={path!r})
+batch.add_factorial_runs(CliRun, {{'A': [0, 1, 2, 3, 4]}})
+
+if __name__ == '__main__':
+    raise Exception('should not be executed')
+"""
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'clibatchdef.py')
+        with open(self.filename, 'w') as f:
+            f.write(BATCHFILE.format(path=self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def main(self, *args):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            code = cli.main(list(args))
+        return code, stdout.getvalue()
+
+    def test_parse_slice(self):
+        self.assertEqual(cli._parse_slice('2/5'), (2, 5))
+        self.assertRaises(ValueError, cli._parse_slice, '5/5')
+        self.assertRaises(ValueError, cli._parse_slice, '2')
+
+    def test_run_status(self):
+        code, out = self.main('status', 'clibatch', '--path', self.path)
+        self.assertIn('0 done', out)
+
+        code, out = self.main('run', self.filename, '--slice', '0/2', '--executor', 'serial', '--verbose', '0',
+                              '--strategy', 'round_robin')
+        self.assertEqual(code, 0)
+
+        code, out = self.main('status', 'clibatch', '--path', self.path)
+        self.assertIn('5 runs, 3 done, 2 pending', out)
+
+        code, out = self.main('run', self.filename, '--slice', '1/2', '--processes', '2', '--verbose', '0',
+                              '--strategy', 'round_robin')
+        code, out = self.main('status', 'clibatch', '--path', self.path)
+        self.assertIn('5 runs, 5 done, 0 pending', out)
+
+    def test_collect(self):
+        self.main('run', self.filename, '--executor', 'serial', '--verbose', '0')
+        output = os.path.join(self.path, 'collected.csv')
+        code, out = self.main('collect', 'clibatch', '--path', self.path, '--output', output)
+
+        with open(output) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['id', 'runtime', 'A'])
+        self.assertEqual(sorted(row[2] for row in rows[1:]), ['0', '1', '2', '3', '4'])
+
+    def test_verify_clean(self):
+        self.main('run', self.filename, '--executor', 'serial', '--verbose', '0')
+        code, out = self.main('verify', 'clibatch', '--path', self.path)
+        self.assertEqual(code, 0)
+        self.assertIn('5 results verified, 0 errors', out)
+
+        savepath = os.path.join(self.path, '_res')
+        filename = sorted(f for f in os.listdir(savepath) if f.endswith('.npy') and not f.endswith('_ids.npy'))[0]
+        with open(os.path.join(savepath, filename), 'r+b') as f:
+            f.truncate(20)
+        with open(os.path.join(savepath, filename + '.123.tmp'), 'w'):
+            pass
+        os.utime(os.path.join(savepath, filename + '.123.tmp'), (0, 0))
+        with open(os.path.join(savepath, filename[:-4] + '.ckpt'), 'w'):
+            pass
+
+        code, out = self.main('verify', 'clibatch', '--path', self.path)
+        self.assertEqual(code, 1)
+        self.assertIn('1 errors', out)
+
+        code, out = self.main('clean', 'clibatch', '--path', self.path, '--dry-run')
+        self.assertIn('2 files to remove', out)
+        self.assertEqual(len(os.listdir(savepath)), 9)
+        code, out = self.main('clean', 'clibatch', '--path', self.path)
+        self.assertEqual(len(os.listdir(savepath)), 7)
+
+    def test_clean_other_batches(self):
+        self.main('run', self.filename, '--executor', 'serial', '--verbose', '0')
+        savepath = os.path.join(self.path, '_res')
+        id = sorted(f for f in os.listdir(savepath) if f.endswith('.npy') and not f.endswith('_ids.npy'))[0][9:-4]
+
+        # files of the batch clibatch_b, of which the names start with clibatch_
+        other = ['clibatch_b_{}.npy'.format(id), 'clibatch_b_{}.ckpt'.format(id),
+                 'clibatch_b_{}.npy.123.tmp'.format(id), 'clibatch_b_summary.npz.123.tmp']
+        for filename in other:
+            with open(os.path.join(savepath, filename), 'w'):
+                pass
+            os.utime(os.path.join(savepath, filename), (0, 0))
+
+        # a temporary file of a process which is still saving
+        live = 'clibatch_{}.npy.{}.tmp'.format(id, os.getpid())
+        with open(os.path.join(savepath, live), 'w'):
+            pass
+
+        code, out = self.main('clean', 'clibatch', '--path', self.path, '--checkpoints')
+        self.assertIn('0 files removed', out)
+        for filename in other + [live]:
+            self.assertTrue(os.path.isfile(os.path.join(savepath, filename)))
+
+        os.utime(os.path.join(savepath, live), (0, 0))
+        code, out = self.main('clean', 'clibatch', '--path', self.path)
+        self.assertIn('1 files removed', out)
+        self.assertFalse(os.path.isfile(os.path.join(savepath, live)))
+
+
+if __name__ == '__main__':
+    unittest.main()
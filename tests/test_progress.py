@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import unittest
+import batchpy
+import io
+import time
+
+from .common import clear_res, MyRun
+
+
+class TestProgress(unittest.TestCase):
+    def test_update(self):
+        progress = batchpy.Progress(10)
+        progress.update(3)
+        progress.update(5, failed=True)
+
+        state = progress.state()
+        self.assertEqual(state.done, 2)
+        self.assertEqual(state.failed, 1)
+        self.assertEqual(state.total, 10)
+        self.assertEqual(state.last, 5)
+        self.assertIsNotNone(state.eta)
+
+    def test_poll_interval(self):
+        states = []
+        progress = batchpy.Progress(10, sinks=states.append, interval=60.)
+        progress.poll()
+        for i in range(10):
+            progress.update(i)
+            progress.poll()
+
+        self.assertEqual(len(states), 1)
+
+        progress.poll(force=True)
+        self.assertEqual(len(states), 2)
+        self.assertEqual(states[-1].done, 10)
+        self.assertEqual(states[-1].eta, 0)
+
+    def test_eta(self):
+        progress = batchpy.Progress(4)
+        progress.update(0)
+        time.sleep(0.1)
+        progress.update(1)
+        state = progress.state()
+        self.assertGreater(state.eta, 0.05)
+        self.assertLess(state.eta, 1.)
+
+    def test_terminal_sink(self):
+        stream = io.StringIO()
+        progress = batchpy.Progress(10, sinks=batchpy.TerminalSink(stream=stream))
+        progress.update(0)
+        progress.poll()
+
+        self.assertTrue(stream.getvalue().startswith('### 1/10 runs'))
+
+    def test_batch_progress(self):
+        clear_res()
+        states = []
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MyRun, {'A': [10, 20, 30]})
+        batch(verbose=0, progress=states.append)
+
+        self.assertEqual(states[-1].done, 3)
+        self.assertEqual(states[-1].total, 3)
+
+    def test_batch_progress_async(self):
+        clear_res()
+        states = []
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        batch.add_factorial_runs(MyRun, {'A': [10, 20, 30]})
+        batch(verbose=0, processes=2, progress=states.append)
+
+        self.assertEqual(states[-1].done, 3)
+        self.assertEqual(states[-1].failed, 0)
+        self.assertTrue(all(run.done for run in batch.run))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,45 @@
 #!/usr/bin/env python
 import unittest
+import os
+import sys
+import subprocess
 import batchpy
 import numpy as np
 
 from .common import clear_res, MyRun
 
 
+class InterruptedRun(batchpy.Run):
+    interrupt = True
+
+    def run(self, steps=10):
+        step, val = self.restore(default=(0, 0))
+        for step in range(step, steps):
+            if step == 5 and self.interrupt:
+                raise KeyboardInterrupt
+            val += step
+            self.checkpoint((step + 1, val))
+        return {'val': val}
+
+
+class SlottedRun(batchpy.Run):
+    __slots__ = ()
+
+    def run(self, A=1, _B=None):
+        return {'A': A, 'B': _B}
+
+
+class StatefulRun(batchpy.Run):
+    def run(self, A=1):
+        self.calls = getattr(self, 'calls', 0) + 1
+        return {'A': A, 'calls': self.calls}
+
+
+class SetRun(batchpy.Run):
+    def run(self, A='a'):
+        return {'A': A in {'a', 'b', 'c', 'd', 'e'}, 'B': A in ({'f', 'g'}, 1)}
+
+
 class TestRun(unittest.TestCase):
     def test_create_run_arguments(self):
         batch = batchpy.Batch(name='testbatch')
@@ -39,6 +73,115 @@ class TestRun(unittest.TestCase):
 
         self.assertEqual(testinstance1.id, '785c2581752f58e9877a01b1ba9d8911c017c2fe')
 
+    def test_create_run_id_versioned(self):
+        batch = batchpy.Batch(name='testbatch')
+
+        class MyVersionedRun(MyRun):
+            versioned = True
+
+        class MyOtherVersionedRun(MyRun):
+            versioned = True
+
+            def run(self, A=1000, B=None, C=np.mean, _D=True):
+                return {'a': A + 1}
+
+        testinstance1 = MyRun(batch, A=2)
+        testinstance2 = MyVersionedRun(batch, A=2)
+        testinstance3 = MyVersionedRun(batch, A=2)
+        testinstance4 = MyOtherVersionedRun(batch, A=2)
+
+        self.assertNotEqual(testinstance1.id, testinstance2.id)
+        self.assertEqual(testinstance2.id, testinstance3.id)
+        self.assertNotEqual(testinstance2.id, testinstance4.id)
+
+    def test_code_hash(self):
+        def f1(x):
+            return x + 1
+
+        def f2(x):
+            return x + 2
+
+        class MyRun1(MyRun):
+            dependencies = (f1,)
+
+        class MyRun2(MyRun):
+            dependencies = (f2,)
+
+        class MyRun3(MyRun):
+            dependencies = (f1,)
+
+        self.assertNotEqual(MyRun1.code_hash(), MyRun2.code_hash())
+        self.assertEqual(MyRun1.code_hash(), MyRun3.code_hash())
+        self.assertNotEqual(MyRun.code_hash(), MyRun1.code_hash())
+
+    def test_code_hash_seed(self):
+        # the code hash does not depend on the hash seed of the interpreter
+        hashes = set()
+        for seed in ['1', '2', '3']:
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            output = subprocess.check_output(
+                [sys.executable, '-c', 'from tests.test_run import SetRun; print(SetRun.code_hash())'],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env)
+            hashes.add(output.strip())
+        self.assertEqual(len(hashes), 1)
+
+    def test_code_metadata(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        testinstance = MyRun(batch, A=100)
+        testinstance()
+
+        metadata = testinstance._load_metadata()
+        self.assertEqual(metadata['code'], {'class': 'MyRun', 'hash': MyRun.code_hash()})
+
+    def test_checkpoint(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        testinstance = InterruptedRun(batch)
+
+        self.assertRaises(KeyboardInterrupt, testinstance)
+        self.assertFalse(testinstance.done)
+        self.assertEqual(testinstance.restore(), (5, 10))
+
+        testinstance = InterruptedRun(batch)
+        testinstance.interrupt = False
+        res = testinstance()
+        self.assertEqual(res['val'], 45)
+        self.assertFalse(os.path.isfile(testinstance.checkpointfilename))
+        self.assertIsNone(testinstance.restore())
+
+    def test_checkpoint_unsaved(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        testinstance = InterruptedRun(batch)
+        self.assertRaises(KeyboardInterrupt, testinstance)
+
+        testinstance = InterruptedRun(batch)
+        testinstance.interrupt = False
+        self.assertEqual(testinstance()['val'], 45)
+        self.assertFalse(os.path.isfile(testinstance.checkpointfilename))
+
+        # a new session does not restore the state of the completed run
+        self.assertIsNone(InterruptedRun(batchpy.Batch(name='testbatch', saveresult=False)).restore())
+
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        testinstance = batch.add_run(InterruptedRun, {'steps': 8})
+        self.assertRaises(KeyboardInterrupt, testinstance)
+        testinstance.interrupt = False
+        batch(verbose=0)
+        self.assertFalse(os.path.isfile(testinstance.checkpointfilename))
+
+    def test_checkpoint_interval(self):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch')
+        testinstance = MyRun(batch)
+
+        self.assertTrue(testinstance.checkpoint(1, interval=60))
+        self.assertFalse(testinstance.checkpoint(2, interval=60))
+        self.assertEqual(testinstance.restore(), 1)
+        self.assertTrue(testinstance.checkpoint(3))
+        self.assertEqual(testinstance.restore(), 3)
+
     def test_create_equal_run(self):
         batch = batchpy.Batch(name='testbatch')
 
@@ -77,6 +220,35 @@ class TestRun(unittest.TestCase):
 
         self.assertEqual(res, {'a': list(range(100)), 'b': [], 'c': rms(list(range(100)))})
 
+    def test_compact(self):
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        run1 = batch.add_run(SlottedRun, {'A': 2})
+        run2 = batch.add_run(SlottedRun, {'A': 3, '_B': 'spam'})
+
+        self.assertFalse(hasattr(run1, '__dict__'))
+        self.assertIs(run1._parameter_keys, run2._parameter_keys)
+        self.assertEqual(run1.parameters, {'A': 2})
+        self.assertEqual(run1(), {'A': 2, 'B': None})
+        self.assertEqual(run2(), {'A': 3, 'B': 'spam'})
+
+        # parameters are returned as a new dictionary
+        run1.parameters['A'] = 5
+        self.assertEqual(run1.parameters, {'A': 2})
+
+    def test_slots_memory(self):
+        batch = batchpy.Batch(name='testbatch')
+        slotted = batch.add_run(SlottedRun, {'A': 2})
+        unslotted = batch.add_run(StatefulRun, {'A': 2})
+
+        # subclasses need their own slots to avoid an instance dictionary
+        self.assertTrue(hasattr(unslotted, '__dict__'))
+        self.assertLess(sys.getsizeof(slotted), sys.getsizeof(unslotted) + sys.getsizeof(unslotted.__dict__))
+
+    def test_subclass_attributes(self):
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        run = batch.add_run(StatefulRun, {'A': 2})
+        self.assertEqual(run(), {'A': 2, 'calls': 1})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import unittest
+import os
+import batchpy
+import pickle
+import numpy as np
+
+from .common import clear_res
+
+
+class SharedRun(batchpy.Run):
+    def run(self, i=0, _data=None):
+        return {'sum': float(_data.sum()) + i, 'writeable': _data.flags.writeable,
+                'shared': float(self.batch.shared['data'][0])}
+
+
+class TestShared(unittest.TestCase):
+    def test_share(self):
+        batch = batchpy.Batch(name='testbatch')
+        data = np.arange(100000.)
+        shared = batch.share('data', data)
+        try:
+            self.assertTrue(np.array_equal(shared, data))
+            self.assertFalse(shared.flags.writeable)
+            self.assertIs(batch.shared['data'], shared)
+
+            self.assertLess(len(pickle.dumps(shared)), 1000)
+            self.assertTrue(np.array_equal(pickle.loads(pickle.dumps(shared)), data))
+
+            # views are pickled by value
+            view = shared[:10]
+            self.assertTrue(np.array_equal(pickle.loads(pickle.dumps(view)), data[:10]))
+        finally:
+            batch.unshare()
+        self.assertEqual(batch.shared, {})
+
+    def test_share_mmap(self):
+        batch = batchpy.Batch(name='testbatch')
+        data = np.arange(100000.)
+        shared = batch.share('data', data, backend='mmap')
+        filename = shared._reference[1]
+        try:
+            self.assertTrue(np.array_equal(shared, data))
+            self.assertFalse(shared.flags.writeable)
+            self.assertLess(len(pickle.dumps(shared)), 1000)
+            self.assertTrue(os.path.isfile(filename))
+        finally:
+            batch.unshare('data')
+        self.assertFalse(os.path.isfile(filename))
+
+    def test_share_object_array(self):
+        batch = batchpy.Batch(name='testbatch')
+        self.assertRaises(ValueError, batch.share, 'data', np.array([{}, []], dtype=object))
+
+    def _run_batch(self, backend):
+        clear_res()
+        batch = batchpy.Batch(name='testbatch', saveresult=False)
+        data = batch.share('data', np.ones(100000), backend=backend)
+        try:
+            batch.add_factorial_runs(SharedRun, {'i': [0, 1, 2], '_data': [data]})
+            batch(verbose=0, processes=2)
+            for run in batch.run:
+                self.assertEqual(run.result, {'sum': 100000. + run.parameters['i'], 'writeable': False,
+                                              'shared': 1.})
+        finally:
+            batch.unshare()
+
+    def test_run_async(self):
+        self._run_batch('auto')
+
+    def test_run_async_mmap(self):
+        self._run_batch('mmap')
+
+
+if __name__ == '__main__':
+    unittest.main()
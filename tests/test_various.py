@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 import unittest
+import sys
+import subprocess
 import batchpy
 import numpy as np
 
@@ -29,6 +31,15 @@ class TestVarious(unittest.TestCase):
         res = batch.run[1].load()
         self.assertEqual(res, {'a': list(range(2000)), 'b': [], 'c': np.mean(list(range(2000)))})
 
+    @unittest.skipIf(sys.version_info < (3, 7), 'module __getattr__ requires python 3.7')
+    def test_lazy_import(self):
+        code = ('import sys, batchpy; print(\'numpy\' in sys.modules, \'multiprocessing.pool\' in sys.modules); '
+                'batchpy.Batch; print(\'numpy\' in sys.modules, \'multiprocessing.pool\' in sys.modules)')
+        output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+        self.assertEqual(output.split(), ['False', 'False', 'True', 'False'])
+        self.assertIn('Batch', dir(batchpy))
+        self.assertRaises(AttributeError, getattr, batchpy, 'spam')
+
 
 if __name__ == '__main__':
     unittest.main()